@@ -1,22 +1,54 @@
 from ffmpeg import output
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 import os
+import json
+import queue
 import shutil
 
 # custom modules
 from modules.config import config
 from modules import line, gemini, subtitle
+from modules.asr import preload_default_engine, default_engine, ctranslate2_models
+from modules.model_registry import whisper_models
+from modules.artifact_store import artifact_store, link_or_copy
+from modules.artifact_store import output_name as artifact_output_name
+from modules.media import send_media
+from modules import uploads
+from modules.jobs import job_queue
+from modules.tmdb_cache import response_cache
+from modules.translation_cache import translation_cache
+from modules.title_resolver import title_resolver
+from modules.title_index import title_index, load_title_index
+from modules.prewarm import start_prewarmer
 from modules.gemini import guess_movie
 from modules.translate_sub import translate_srt
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
+# 上傳的檔案直接串流寫入暫存檔並同時計算 SHA-256
+app.request_class = uploads.UploadRequest
+app.config['UPLOAD_FOLDER'] = uploads.UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = max(kind['max_bytes'] for kind in uploads.UPLOAD_KINDS.values()) + uploads.MB
+# 在支援 X-Sendfile 的伺服器 (Apache / lighttpd) 後面時，由伺服器直接傳送檔案
+app.config['USE_X_SENDFILE'] = config.getboolean('Media', 'X_SENDFILE', fallback=False)
 
 # 創建上傳文件夾
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+prewarmer = None
+# 分段轉錄以 spawn 建立的子程序會重新載入 app.py（__mp_main__），只在主程序執行以下啟動工作
+if __name__ != '__mp_main__':
+    # 預先載入 Whisper 模型（config.ini [Whisper] PRELOAD）
+    preload_default_engine()
+
+    # 載入本機電影名稱索引（沒有索引檔時從 TMDB 回應快取建立）
+    load_title_index()
+
+    # 定期預熱熱門與上映中電影（config.ini [Prewarm] ENABLED）
+    prewarmer = start_prewarmer()
+
 def clean_uploads_folder():
     """
     清空 uploads 文件夾
@@ -84,9 +116,15 @@ def send_message():
     if not message:
         return jsonify({'reply': '請輸入訊息'}), 400
 
+    # 每個網頁用戶端有各自的對話紀錄
+    user_id = f"web:{data.get('client_id') or request.remote_addr}"
+    if message.strip() == '@' + line.NEW_CHAT_COMMAND:
+        gemini.new_chat(user_id)
+        return jsonify({'reply': '已開始新的對話'})
+
     # 使用當前的聊天模式處理訊息
     if line.chat_mode == line.ChatMode.GEMINI:
-        reply = gemini.chat(message, line.uploaded_images)
+        reply = gemini.chat(message, line.uploaded_images, user_id=user_id)
     else:
         reply = line.command_handler(message)
     return jsonify({'reply': reply})
@@ -96,35 +134,43 @@ def upload_file():
     """
     處理文件上傳
     """
-    if 'file' not in request.files:
-        return jsonify({'reply': '沒有檔案被上傳'}), 400
-
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'reply': '沒有選擇檔案'}), 400
+    # 影片與圖片有不同的大小與類型限制，在寫入檔案前就檢查；
+    # SUB_TRANSLATE 以外的模式上傳的檔案會交給 Gemini 當作圖片開啟，只接受圖片副檔名
+    kind = 'video' if line.chat_mode == line.ChatMode.SUB_TRANSLATE else 'image'
+    try:
+        file_path, digest, original_filename = uploads.receive_upload(kind)
+    except HTTPException as e:
+        return jsonify({'reply': e.description}), e.code
 
-    if file:
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+    if file_path:
+        filename = secure_filename(original_filename)
         line.uploaded_images.append(file_path)
 
         if line.chat_mode == line.ChatMode.GUESS_MOVIE:
             reply = gemini.guess_movie([file_path])
         if line.chat_mode == line.ChatMode.SUB_TRANSLATE:
-            # create outputs folder
-            if not os.path.exists('outputs'):
-                os.makedirs('outputs')
-            output_path = os.path.abspath('outputs').replace("\\", "/")
-            input_file_path = os.path.abspath(file_path).replace("\\", "/")
-            output_video_path = os.path.abspath(f'uploads/subtitled_{filename}').replace("\\", "/")
-            subtitle_path = f'outputs/{filename}.srt'
-            subtitle.video_to_subtitle(input_file_path, subtitle_path)
-
-            # generate subtitled video
-
-            subtitle.embed_subtitles(output_path, input_file_path, f'{filename}.srt', output_video_path)
-            reply = request.url_root + f'uploads/subtitled_{filename}'
+            mode = subtitle.effective_mode(filename, subtitle.subtitle_mode(request.form.get('subtitle_mode')))
+            output_name = artifact_output_name(digest, default_engine.cache_key, None, mode, filename)
+            result_url = request.url_root + f'uploads/{output_name}'
+
+            # 相同內容的影片已處理過，直接回傳快取結果
+            cached = artifact_store.get(digest, default_engine.cache_key, None, _video_artifact_name(filename, mode))
+            if cached:
+                link_or_copy(cached, os.path.join(app.config['UPLOAD_FOLDER'], output_name))
+                return jsonify({'reply': result_url, 'filename': filename})
+
+            # 字幕工作放到背景佇列執行，立即回傳 job ID
+            try:
+                job = job_queue.submit(_subtitle_job, digest, file_path, output_name, mode, result_url=result_url)
+            except queue.Full:
+                return jsonify({'reply': '目前字幕工作過多，請稍後再試'}), 503
+            return jsonify({
+                'reply': f'檔案 {filename} 上傳成功，字幕處理中',
+                'filename': filename,
+                'job_id': job.id,
+                'status_url': request.url_root + f'jobs/{job.id}',
+                'events_url': request.url_root + f'jobs/{job.id}/events',
+            }), 202
         else:
             reply = f'檔案 {filename} 上傳成功'
 
@@ -132,12 +178,139 @@ def upload_file():
 
     return jsonify({'reply': '檔案上傳失敗'}), 400
 
+def _video_artifact_name(filename, mode):
+    """
+    快取中加上字幕後影片的名稱，包含字幕模式並保留原始副檔名
+    """
+    return f'video_{mode}' + os.path.splitext(filename)[1]
+
+def _subtitle_job(job, digest, file_path, output_name, mode):
+    """
+    背景執行的字幕工作：擷取音訊、轉錄並燒錄字幕。
+    """
+    # create outputs folder
+    if not os.path.exists('outputs'):
+        os.makedirs('outputs')
+    base_name = os.path.basename(file_path)
+    output_path = os.path.abspath('outputs').replace("\\", "/")
+    input_file_path = os.path.abspath(file_path).replace("\\", "/")
+    output_video_path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], output_name)).replace("\\", "/")
+    subtitle_path = f'outputs/{base_name}.srt'
+    subtitle.video_to_subtitle(input_file_path, subtitle_path, job=job, digest=digest,
+                               on_segments=subtitle.cue_publisher(job))
+
+    # generate subtitled video
+    job.update("燒錄字幕" if mode == "burn" else "封裝字幕軌", 70)
+    if os.path.exists(output_video_path):
+        os.unlink(output_video_path)
+    mode = subtitle.embed_subtitles(output_path, input_file_path, f'{base_name}.srt', output_video_path, mode=mode)
+    if not os.path.exists(output_video_path):
+        raise RuntimeError("字幕嵌入失敗")
+    artifact_store.put(digest, default_engine.cache_key, None, _video_artifact_name(base_name, mode), output_video_path)
+
+@app.route('/upload_sessions', methods=['POST'])
+def create_upload_session():
+    """
+    建立分段續傳，body 為 JSON：{"filename", "size", "kind"}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        session = uploads.upload_sessions.create(
+            data.get('kind', 'video'), data.get('filename', ''), int(data.get('size', 0)),
+            client=request.remote_addr)
+    except (TypeError, ValueError):
+        return jsonify({'reply': '檔案大小格式錯誤'}), 400
+    except HTTPException as e:
+        return jsonify({'reply': e.description}), e.code
+    return jsonify(session.to_dict()), 201
+
+@app.route('/upload_sessions/<upload_id>', methods=['GET'])
+def upload_session_status(upload_id):
+    """
+    查詢分段續傳已收到的位移，中斷後從這裡繼續上傳
+    """
+    session = uploads.upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({'reply': '找不到上傳'}), 404
+    return jsonify(session.to_dict())
+
+@app.route('/upload_sessions/<upload_id>', methods=['PUT'])
+def upload_session_chunk(upload_id):
+    """
+    上傳一段資料，以 Content-Range: bytes start-end/total 指定位置，內容直接寫入暫存檔
+    """
+    try:
+        length = request.content_length or 0
+        start = uploads.parse_content_range(request.headers.get('Content-Range'), length)
+        session = uploads.upload_sessions.append(upload_id, start, request.stream, length)
+    except HTTPException as e:
+        current = uploads.upload_sessions.get(upload_id)
+        return jsonify({'reply': e.description, 'offset': current.offset if current else 0}), e.code
+    return jsonify(session.to_dict())
+
+@app.route('/upload_sessions/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """
+    完成分段續傳，之後以表單欄位 upload_id 代替檔案呼叫 /upload_file 或 /translate_srt
+    """
+    try:
+        session = uploads.upload_sessions.complete(upload_id)
+    except HTTPException as e:
+        return jsonify({'reply': e.description}), e.code
+    return jsonify(session.to_dict())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """
+    查詢背景工作的階段、進度與結果網址
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'reply': '找不到工作'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    以 Server-Sent Events 推送背景工作事件：進度、逐段產生的字幕，以及最後的影片網址
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'reply': '找不到工作'}), 404
+    start = request.headers.get('Last-Event-ID', type=int, default=0)
+
+    def stream():
+        for event_id, event, data in job.iter_events(start):
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            yield f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/cache_stats')
+def cache_stats():
+    """
+    各快取的命中率與已載入語音辨識模型的載入耗時、常駐記憶體，供調整快取大小、有效時間與記憶體預算參考
+    """
+    return jsonify({
+        'tmdb': response_cache.stats(),
+        'titles': title_resolver.stats(),
+        'title_index': title_index.stats(),
+        'prewarm': prewarmer.stats() if prewarmer else None,
+        'translation': translation_cache.stats(),
+        'chat_sessions': gemini.chat_sessions.stats(),
+        'whisper_models': whisper_models.stats(),
+        'ctranslate2_models': ctranslate2_models.stats(),
+    })
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     """
-    提供上傳文件的路由
+    提供上傳文件的路由，支援 Range、ETag 與條件式 GET；?download=1 以下載方式傳送
     """
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_media(app.config['UPLOAD_FOLDER'], filename, as_attachment=request.args.get('download') == '1')
 
 @app.route('/')
 def hello_world():
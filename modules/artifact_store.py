@@ -0,0 +1,119 @@
+"""
+字幕工作產物快取。
+
+以上傳檔案內容的 SHA-256 加上模型大小與目標語言為鍵，保存產生過的 SRT 與燒錄後的影片。
+同一個檔案再次上傳時直接回傳快取結果；檔名相同但內容不同的檔案不會拿到彼此的結果。
+總大小超過上限時，依最近使用時間淘汰最舊的產物。
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from werkzeug.utils import secure_filename
+
+from modules.config import config
+
+
+def output_name(digest: str, model_size: str, target_languages, mode: str, filename: str) -> str:
+    """
+    產生輸出影片的檔名。檔名由內容雜湊與處理參數決定，不同內容或參數不會共用檔名；
+    同一個檔名重新產生時內容可能不同，傳送時需以 ETag 重新驗證。
+    語言依要求的順序組成鍵，燒錄模式使用第一個語言，順序不同的結果不會共用。
+    """
+    languages = "-".join(target_languages) if target_languages else "original"
+    variant = hashlib.sha256(f"{digest}|{model_size}|{languages}|{mode}".encode("utf-8")).hexdigest()
+    return f"subtitled_{variant[:16]}_{secure_filename(filename)}"
+
+
+def link_or_copy(src: str, dst: str):
+    """
+    以硬連結取代複製，跨檔案系統時改用複製。
+    """
+    if os.path.exists(dst):
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ArtifactStore:
+    def __init__(self, root: str, max_bytes: int = 0):
+        """
+        :param root: 產物儲存資料夾
+        :param max_bytes: 總大小上限，0 表示不限制
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, digest: str, model_size: str, target_languages=None) -> str:
+        languages = "-".join(target_languages) if target_languages else "original"
+        return os.path.join(self.root, digest, f"{secure_filename(model_size)}_{secure_filename(languages)}")
+
+    def get(self, digest: str, model_size: str, target_languages, name: str):
+        """
+        取得快取的產物路徑，找不到時回傳 None。
+        :param name: 產物名稱，例如 "subtitles.srt"
+        """
+        entry_dir = self._entry_dir(digest, model_size, target_languages)
+        path = os.path.join(entry_dir, name)
+        if not os.path.exists(path):
+            return None
+        # 更新使用時間供淘汰參考
+        now = time.time()
+        os.utime(entry_dir, (now, now))
+        return path
+
+    def put(self, digest: str, model_size: str, target_languages, name: str, src_path: str) -> str:
+        """
+        將產物存入快取，並在超過大小上限時淘汰最舊的產物。
+        :return: 快取中的產物路徑
+        """
+        entry_dir = self._entry_dir(digest, model_size, target_languages)
+        os.makedirs(entry_dir, exist_ok=True)
+        path = os.path.join(entry_dir, name)
+        link_or_copy(src_path, path)
+        self.evict(keep=entry_dir)
+        return path
+
+    def evict(self, keep: str = None):
+        """
+        總大小超過上限時，依最近使用時間由舊到新刪除產物。
+        """
+        if not self.max_bytes:
+            return
+        with self._lock:
+            entries = []
+            total = 0
+            for digest in os.listdir(self.root):
+                digest_dir = os.path.join(self.root, digest)
+                if not os.path.isdir(digest_dir):
+                    continue
+                for variant in os.listdir(digest_dir):
+                    entry_dir = os.path.join(digest_dir, variant)
+                    size = sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+                    entries.append((os.path.getmtime(entry_dir), entry_dir, size))
+                    total += size
+
+            for _, entry_dir, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if entry_dir == keep:
+                    continue
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                parent = os.path.dirname(entry_dir)
+                if not os.listdir(parent):
+                    os.rmdir(parent)
+                print(f"已淘汰字幕產物：{entry_dir}")
+
+
+artifact_store = ArtifactStore(
+    root=config.get("Artifacts", "PATH", fallback="artifacts"),
+    max_bytes=config.getint("Artifacts", "MAX_SIZE_MB", fallback=5120) * 1024 * 1024,
+)
@@ -0,0 +1,159 @@
+"""
+語音辨識引擎。
+
+transcribe_audio 透過這裡的引擎取得帶時間戳的 segments（含 start, end, text），
+不同引擎輸出的結構相同，產生的 SRT 也相同。
+
+- whisper：openai-whisper，float32 於 PyTorch 上執行。
+- ctranslate2：faster-whisper (CTranslate2)，預設以 int8 量化在 CPU 上執行，
+  準確度略降，但速度快數倍，每個子程序的記憶體也較少。
+"""
+
+import os
+from abc import ABC, abstractmethod
+
+from modules.config import config
+from modules.model_registry import ModelRegistry, whisper_models, default_model_size
+
+# 使用的引擎："whisper" 或 "ctranslate2"
+ENGINE = config.get("Whisper", "ENGINE", fallback="whisper")
+# CTranslate2 的運算精度，例如 int8, int8_float32, float32
+COMPUTE_TYPE = config.get("Whisper", "COMPUTE_TYPE", fallback="int8")
+# CTranslate2 的 beam size；1 為 greedy decoding，與 openai-whisper 預設相同
+BEAM_SIZE = config.getint("Whisper", "BEAM_SIZE", fallback=1)
+# CTranslate2 的 CPU 執行緒數，0 表示由 CTranslate2 自動決定；分段轉錄的子程序會改用 THREADS_PER_WORKER
+CPU_THREADS = config.getint("Whisper", "CPU_THREADS", fallback=0)
+
+
+class ASREngine(ABC):
+    """
+    語音辨識引擎的介面。
+    """
+    name = None
+
+    def __init__(self, model_size: str):
+        self.model_size = model_size
+
+    @property
+    def cache_key(self) -> str:
+        """
+        字幕產物快取使用的模型鍵，不同引擎或精度的結果不會共用快取。
+        """
+        return self.model_size
+
+    def set_threads(self, threads: int):
+        """
+        設定轉錄使用的執行緒數，需在載入模型前呼叫。
+        """
+
+    @abstractmethod
+    def load(self):
+        """
+        載入模型（已載入時直接回傳）。
+        """
+
+    @abstractmethod
+    def transcribe(self, audio) -> list[dict]:
+        """
+        轉錄音訊。
+        :param audio: 音訊檔案路徑，或 16 kHz 單聲道 float32 PCM 陣列
+        :return: segments 列表，每個元素含 start, end（秒）與 text
+        """
+
+
+class WhisperEngine(ASREngine):
+    name = "whisper"
+
+    def set_threads(self, threads: int):
+        import torch
+        torch.set_num_threads(threads)
+
+    def load(self):
+        return whisper_models.get(self.model_size)
+
+    def transcribe(self, audio) -> list[dict]:
+        result = self.load().transcribe(audio)
+        return [{"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+                for segment in result["segments"]]
+
+
+def _load_ctranslate2_model(name: str):
+    from faster_whisper import WhisperModel
+    return WhisperModel(name, device="cpu", compute_type=COMPUTE_TYPE, cpu_threads=_ctranslate2_threads)
+
+
+# 相對於 float16 模型檔的權重大小
+_COMPUTE_TYPE_SCALE = {"int8": 0.5, "int8_float32": 0.5, "int8_float16": 0.5, "float16": 1.0, "float32": 2.0}
+
+
+def _ctranslate2_resident_bytes(name: str, model) -> int:
+    """
+    CTranslate2 不提供權重大小，以模型檔 (model.bin，float16) 的大小依運算精度換算估計。
+    """
+    try:
+        from faster_whisper.utils import download_model
+        model_file = os.path.join(download_model(name, local_files_only=True), "model.bin")
+        return int(os.path.getsize(model_file) * _COMPUTE_TYPE_SCALE.get(COMPUTE_TYPE, 1.0))
+    except Exception as e:
+        print(f"無法估計 CTranslate2 模型 {name} 的大小：{e}")
+        return 0
+
+
+_ctranslate2_threads = CPU_THREADS
+
+ctranslate2_models = ModelRegistry(
+    _load_ctranslate2_model,
+    sizer=_ctranslate2_resident_bytes,
+    memory_budget_mb=config.getint("Whisper", "MEMORY_BUDGET_MB", fallback=0),
+    idle_timeout=config.getfloat("Whisper", "IDLE_TIMEOUT", fallback=0),
+)
+
+
+class CTranslate2Engine(ASREngine):
+    name = "ctranslate2"
+
+    @property
+    def cache_key(self) -> str:
+        return f"ct2-{COMPUTE_TYPE}-{self.model_size}"
+
+    def set_threads(self, threads: int):
+        global _ctranslate2_threads
+        _ctranslate2_threads = threads
+
+    def load(self):
+        return ctranslate2_models.get(self.model_size)
+
+    def transcribe(self, audio) -> list[dict]:
+        # faster-whisper 回傳的 segments 是 generator，逐段解碼
+        segments, _ = self.load().transcribe(audio, beam_size=BEAM_SIZE)
+        return [{"start": segment.start, "end": segment.end, "text": segment.text} for segment in segments]
+
+
+ENGINES = {
+    WhisperEngine.name: WhisperEngine,
+    CTranslate2Engine.name: CTranslate2Engine,
+}
+
+
+def get_engine(name: str = None, model_size: str = None) -> ASREngine:
+    """
+    取得語音辨識引擎。
+    :param name: 引擎名稱，預設為 config.ini 中的 [Whisper] ENGINE
+    :param model_size: 模型大小，預設為 [Whisper] MODEL_SIZE
+    """
+    name = name or ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"未知的語音辨識引擎：{name}")
+    return ENGINES[name](model_size or default_model_size)
+
+
+default_engine = get_engine()
+
+
+def preload_default_engine():
+    """
+    若 config.ini 中 [Whisper] PRELOAD 為 true，於啟動時在背景預先載入預設引擎的模型。
+    """
+    if config.getboolean("Whisper", "PRELOAD", fallback=False):
+        registry = ctranslate2_models if isinstance(default_engine, CTranslate2Engine) else whisper_models
+        registry.preload(default_engine.model_size)
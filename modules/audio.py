@@ -0,0 +1,203 @@
+"""
+音訊擷取。
+
+以單一 FFmpeg process 將影片的音軌解碼成 16 kHz 單聲道 float32 PCM，
+直接透過 pipe 讀進 NumPy 陣列，供 Whisper 轉錄使用，不需要中間的音訊檔。
+轉錄前可以用 speech_regions 找出有聲音的區段，只轉錄這些區段後再把時間戳換算回原時間軸。
+"""
+
+import subprocess
+import tempfile
+
+import numpy as np
+
+# Whisper 使用的取樣率
+SAMPLE_RATE = 16000
+
+# 每次從 pipe 讀取的大小
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+def load_pcm(media_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    以 FFmpeg 解碼音軌為單聲道 float32 PCM。
+    :param media_path: 影片或音訊檔案路徑
+    :param sample_rate: 取樣率
+    :return: 一維 float32 陣列，數值介於 -1~1
+    :raises RuntimeError: FFmpeg 執行失敗
+    """
+    command = [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        "-i", media_path,
+        "-vn", "-map", "a:0",                   # 只取第一條音軌，不解碼影像
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-ac", "1", "-ar", str(sample_rate),
+        "-",
+    ]
+    # 逐段讀進同一個 bytearray，記憶體峰值約為 PCM 大小本身，不會再有一份完整的 bytes 複本；
+    # stderr 寫入暫存檔，避免 pipe 寫滿時 FFmpeg 卡住
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+        buffer = bytearray()
+        chunk = bytearray(READ_CHUNK_BYTES)
+        view = memoryview(chunk)
+        with process.stdout:
+            while True:
+                size = process.stdout.readinto(view)
+                if not size:
+                    break
+                buffer += view[:size]
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"FFmpeg 解碼音訊失敗：{stderr.read().decode(errors='ignore')}")
+
+    # bytearray 是可寫入的緩衝區（torch.from_numpy 需要可寫入的陣列），frombuffer 不會再複製
+    usable = len(buffer) - len(buffer) % 4
+    return np.frombuffer(buffer, dtype=np.float32, count=usable // 4)
+
+
+def duration_seconds(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> float:
+    """
+    計算 PCM 長度（秒）。
+    """
+    return len(samples) / sample_rate
+
+
+def frame_rms(samples: np.ndarray, frame_seconds: float = 0.03, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    計算每個音框的 RMS 能量。
+    :param frame_seconds: 音框長度（秒）
+    :return: 每個音框的 RMS，長度為 len(samples) // 音框樣本數
+    """
+    frame_length = max(1, int(frame_seconds * sample_rate))
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+
+
+def split_at_silences(samples: np.ndarray, target_seconds: float, search_seconds: float = 5.0,
+                      frame_seconds: float = 0.03, sample_rate: int = SAMPLE_RATE) -> list[tuple[int, int]]:
+    """
+    將音訊切成約 target_seconds 長的區段，切點選在目標位置前後 search_seconds 內最安靜的音框，
+    避免把一句話從中間切開。
+    :return: (起始樣本, 結束樣本) 列表
+    """
+    total = len(samples)
+    target = int(target_seconds * sample_rate)
+    if target <= 0 or total <= target:
+        return [(0, total)]
+
+    rms = frame_rms(samples, frame_seconds, sample_rate)
+    frame_length = max(1, int(frame_seconds * sample_rate))
+    search_frames = int(search_seconds / frame_seconds)
+
+    chunks = []
+    start = 0
+    while total - start > target:
+        center = (start + target) // frame_length
+        low = max(start // frame_length + 1, center - search_frames)
+        high = min(len(rms), center + search_frames + 1)
+        if low >= high:
+            split = start + target
+        else:
+            split = (low + int(np.argmin(rms[low:high]))) * frame_length + frame_length // 2
+        chunks.append((start, split))
+        start = split
+    chunks.append((start, total))
+    return chunks
+
+
+def speech_regions(samples: np.ndarray, margin_db: float = 12.0, min_speech_seconds: float = 0.25,
+                   min_silence_seconds: float = 0.6, pad_seconds: float = 0.3,
+                   frame_seconds: float = 0.03, sample_rate: int = SAMPLE_RATE) -> list[tuple[int, int]]:
+    """
+    以音框能量偵測有聲音的區段（VAD）。門檻為背景噪音（能量第 10 百分位）加上 margin_db，
+    間隔短於 min_silence_seconds 的區段會合併，短於 min_speech_seconds 的區段會被捨棄，
+    每個區段前後保留 pad_seconds 避免切掉字首字尾。
+    :return: (起始樣本, 結束樣本) 列表，依時間排序且不重疊
+    """
+    rms = frame_rms(samples, frame_seconds, sample_rate)
+    if len(rms) == 0:
+        return []
+    db = 20 * np.log10(rms + 1e-10)
+    # 絕對靜音的門檻下限，避免整段都很安靜時把雜訊當成語音
+    threshold = max(float(np.percentile(db, 10)) + margin_db, -50.0)
+    voiced = np.concatenate(([0], (db > threshold).astype(np.int8), [0]))
+    edges = np.diff(voiced)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    frame_length = max(1, int(frame_seconds * sample_rate))
+    min_silence_frames = int(min_silence_seconds / frame_seconds)
+    min_speech_frames = int(min_speech_seconds / frame_seconds)
+    pad = int(pad_seconds * sample_rate)
+
+    merged = []
+    for start, end in zip(starts, ends):
+        if merged and start - merged[-1][1] < min_silence_frames:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    regions = []
+    for start, end in merged:
+        if end - start < min_speech_frames:
+            continue
+        start = max(0, int(start) * frame_length - pad)
+        end = min(len(samples), int(end) * frame_length + pad)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def skipped_fraction(regions: list[tuple[int, int]], total: int) -> float:
+    """
+    計算 VAD 略過的音訊比例。
+    """
+    if total <= 0:
+        return 0.0
+    return 1 - sum(end - start for start, end in regions) / total
+
+
+def compact_regions(samples: np.ndarray, regions: list[tuple[int, int]], gap_seconds: float = 0.2,
+                    sample_rate: int = SAMPLE_RATE) -> tuple[np.ndarray, list[tuple[float, float]]]:
+    """
+    將有聲音的區段接成一段較短的音訊，區段之間插入 gap_seconds 的靜音，讓轉錄時不會把兩句話黏在一起。
+    :return: (接好的 PCM, [(在新音訊中的起始秒數, 在原音訊中的起始秒數)])，供 restore_timestamps 換算
+    """
+    gap = np.zeros(int(gap_seconds * sample_rate), dtype=samples.dtype)
+    pieces = []
+    offsets = []
+    position = 0
+    for start, end in regions:
+        if pieces:
+            pieces.append(gap)
+            position += len(gap)
+        offsets.append((position / sample_rate, start / sample_rate))
+        pieces.append(samples[start:end])
+        position += end - start
+    if not pieces:
+        return np.zeros(0, dtype=samples.dtype), []
+    return np.concatenate(pieces), offsets
+
+
+def restore_timestamps(segments: list[dict], offsets: list[tuple[float, float]]) -> list[dict]:
+    """
+    將 compact_regions 後音訊的 segments 時間戳換算回原音訊的時間軸。
+    """
+    compact_starts = [compact for compact, _ in offsets]
+
+    def restore(seconds):
+        i = max(0, int(np.searchsorted(compact_starts, seconds, side="right")) - 1)
+        compact, original = offsets[i]
+        return float(original + max(0.0, seconds - compact))
+
+    restored = []
+    for segment in segments:
+        start = restore(segment["start"])
+        restored.append({**segment, "start": start, "end": max(start, restore(segment["end"]))})
+    return restored
@@ -1,4 +1,6 @@
 from modules.config import config
+from modules.translation_cache import translation_cache
+from modules import langid
 
 
 # Azure Translation
@@ -8,7 +10,11 @@ from azure.core.credentials import AzureKeyCredential
 from azure.core.exceptions import HttpResponseError
 
 
-# Translator Setup
+# 本機語言偵測的信心達到此值時直接採用，不再呼叫 Azure 偵測
+DETECT_THRESHOLD = config.getfloat("AzureTranslator", "DETECT_THRESHOLD", fallback=0.8)
+
+
+# Translator Setup（所有模組共用同一個翻譯客戶端）
 text_translator = TextTranslationClient(
     credential=AzureKeyCredential(config["AzureTranslator"]["Key"]),
     endpoint=config["AzureTranslator"]["EndPoint"],
@@ -16,22 +22,64 @@ text_translator = TextTranslationClient(
 )
 
 
+def translate_texts(texts: list[str], target_languages: list[str], source_language: str = None) -> list[dict]:
+    """
+    經過翻譯記憶快取的翻譯：只有快取中沒有的文字才會送到 Azure，且相同文字只送一次。
+    本機偵測確定已經是目標語言的文字不會送出翻譯。
+    發生 HttpResponseError 時由呼叫者處理。
+    :param texts: 要翻譯的文字列表
+    :param target_languages: 目標語言列表
+    :param source_language: 來源語言，None 表示由 Azure 自動偵測
+    :return: 與 texts 索引一一對應的 {目標語言: 譯文}
+    """
+    results = [{} for _ in texts]
+    missing: dict[str, set] = {}
+    for index, text in enumerate(texts):
+        detected, confidence = langid.detect(text) if source_language is None else (source_language, 1.0)
+        for language in target_languages:
+            if confidence >= DETECT_THRESHOLD and detected.lower() == language.lower():
+                results[index][language] = text
+                continue
+            translation = translation_cache.get(text, source_language, language)
+            if translation is None:
+                missing.setdefault(text, set()).add(language)
+            else:
+                results[index][language] = translation
+
+    if missing:
+        # 依照缺少的目標語言分組，每組只需要一個請求
+        groups: dict[tuple, list[str]] = {}
+        for text, languages in missing.items():
+            groups.setdefault(tuple(sorted(languages)), []).append(text)
+
+        translated: dict[str, dict] = {}
+        for languages, group_texts in groups.items():
+            response = text_translator.translate(
+                body=group_texts, to_language=list(languages), from_language=source_language
+            )
+            new_items = []
+            for text, item in zip(group_texts, response):
+                # 譯文順序與 to_language 相同
+                translated[text] = {to: trans.text for to, trans in zip(languages, item.translations)}
+                new_items.extend((text, source_language, to, trans_text)
+                                 for to, trans_text in translated[text].items())
+            translation_cache.put_many(new_items)
+
+        for index, text in enumerate(texts):
+            results[index].update(translated.get(text, {}))
+
+    return results
+
+
 def azure_translate(user_input):
 
     try:
         target_languages = ["en"]
-        # input_text_elements = [InputTextItem(text=user_input)]
-        input_text_elements = [user_input]
-
-        response = text_translator.translate(
-            body=input_text_elements, to_language=target_languages
-        )
-        print(response)
-        translation = response[0] if response else None
+        translation = translate_texts([user_input], target_languages)[0]
 
         if translation:
-            return translation.translations[0].text
+            return translation.get("en")
 
     except HttpResponseError as exception:
         print(f"Error Code: {exception.error}")
-        print(f"Message: {exception.error.message}")
\ No newline at end of file
+        print(f"Message: {exception.error.message}")
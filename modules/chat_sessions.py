@@ -0,0 +1,238 @@
+"""
+Gemini 對話 session 管理。
+
+每個使用者（LINE user ID 或網頁用戶端 ID）各自有一個 ChatSession，保存在有上限的 LRU 中；
+每次對話前檢查歷史紀錄的 token 數，超過預算時刪除（或摘要）最舊的對話，
+讓每次 send_message 送出的內容大小固定，不會隨伺服器執行時間越來越慢。
+可選擇將 session 寫入磁碟，重新啟動或被淘汰後仍能接續對話。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 每張圖片在 Gemini 中約佔的 token 數
+IMAGE_TOKENS = 258
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文字的 token 數：中日韓文字約一字一 token，其他文字約四個字元一 token。
+    """
+    wide = sum(1 for char in text if ord(char) > 0x2E7F)
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _part_text(part):
+    # 磁碟載入的歷史紀錄中 part 是字串，Gemini 回傳的是有 text 屬性的 Part
+    if isinstance(part, str):
+        return part
+    return part.get("text") if isinstance(part, dict) else getattr(part, "text", None)
+
+
+def _content_role(content):
+    return content["role"] if isinstance(content, dict) else content.role
+
+
+def _content_parts(content):
+    return content["parts"] if isinstance(content, dict) else content.parts
+
+
+def content_tokens(content) -> int:
+    """
+    估算一則歷史紀錄（使用者或模型的一次發言）的 token 數。
+    """
+    total = 0
+    for part in _content_parts(content):
+        text = _part_text(part)
+        total += estimate_tokens(text) if text else IMAGE_TOKENS
+    return total
+
+
+class ChatSessionEntry:
+    """
+    一個使用者的對話：Gemini ChatSession、避免同一個使用者同時送出訊息的鎖與最後使用時間。
+    closed 表示已被清除或淘汰（已寫入磁碟），不可再使用也不再寫入磁碟。
+    """
+    __slots__ = ("user_id", "session", "lock", "last_used", "closed")
+
+    def __init__(self, user_id: str, session):
+        self.user_id = user_id
+        self.session = session
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        self.closed = False
+
+
+class ChatSessionStore:
+    def __init__(self, model, max_sessions: int = 1000, token_budget: int = 8000,
+                 snapshot_dir: str = None, summarize: bool = False):
+        """
+        :param model: genai.GenerativeModel，用來建立 ChatSession（與摘要舊對話）
+        :param max_sessions: 記憶體中最多保存的 session 數，超過時淘汰最久未使用的
+        :param token_budget: 每個 session 歷史紀錄的 token 上限
+        :param snapshot_dir: session 寫入磁碟的資料夾，None 表示不寫入
+        :param summarize: 超過預算時是否將刪除的舊對話摘要後保留，False 時直接刪除
+        """
+        self.model = model
+        self.max_sessions = max_sessions
+        self.token_budget = token_budget
+        self.snapshot_dir = snapshot_dir
+        self.summarize = summarize
+        self._sessions: OrderedDict[str, ChatSessionEntry] = OrderedDict()
+        # 已淘汰但尚未寫入磁碟的 session；這段期間再次使用時直接放回，不會載入舊的磁碟紀錄
+        self._evicting: dict[str, ChatSessionEntry] = {}
+        self._lock = threading.Lock()
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+    def get(self, user_id: str) -> ChatSessionEntry:
+        """
+        取得使用者的 session；記憶體中沒有時從磁碟載入，或建立新的 session。
+        取得後需持有 entry.lock 並確認 entry.closed 為 False 才能使用，建議改用 session()。
+        """
+        with self._lock:
+            entry = self._sessions.get(user_id) or self._evicting.pop(user_id, None)
+            if entry is not None:
+                self._sessions[user_id] = entry
+                self._sessions.move_to_end(user_id)
+                entry.last_used = time.time()
+                return entry
+            entry = ChatSessionEntry(user_id, self.model.start_chat(history=self._load(user_id)))
+            self._sessions[user_id] = entry
+            evicted = []
+            while len(self._sessions) > self.max_sessions:
+                old = self._sessions.popitem(last=False)[1]
+                self._evicting[old.user_id] = old
+                evicted.append(old)
+        for old in evicted:
+            self._evict(old)
+        return entry
+
+    @contextmanager
+    def session(self, user_id: str):
+        """
+        取得使用者的 session 並持有其鎖；取得時剛好被清除或淘汰的話，改用新的 session。
+        """
+        while True:
+            entry = self.get(user_id)
+            with entry.lock:
+                if not entry.closed:
+                    yield entry
+                    return
+
+    def _evict(self, entry: ChatSessionEntry):
+        # 寫入磁碟後才移出 _evicting；寫入期間被再次使用的 session 不會被關閉
+        with entry.lock:
+            try:
+                self.save(entry)
+            except OSError as e:
+                print(f"寫入對話紀錄失敗：{e}")
+            with self._lock:
+                if self._evicting.get(entry.user_id) is entry:
+                    del self._evicting[entry.user_id]
+                    entry.closed = True
+
+    def reset(self, user_id: str):
+        """
+        清除使用者的對話紀錄。進行中的對話結束後才清除，之後也不會再寫回磁碟。
+        """
+        with self._lock:
+            entry = self._sessions.pop(user_id, None) or self._evicting.pop(user_id, None)
+        if entry is not None:
+            with entry.lock:
+                entry.closed = True
+                self._remove_snapshot(user_id)
+        else:
+            self._remove_snapshot(user_id)
+
+    def _remove_snapshot(self, user_id: str):
+        path = self._snapshot_path(user_id)
+        if path and os.path.exists(path):
+            os.unlink(path)
+
+    def enforce_budget(self, entry: ChatSessionEntry, reserve: int = 0):
+        """
+        歷史紀錄加上這次輸入超過 token 預算時，由舊到新刪除整組對話（使用者與模型各一則）。
+        呼叫者需持有 entry.lock。
+        :param reserve: 這次輸入預估的 token 數
+        """
+        history = list(entry.session.history)
+        tokens = [content_tokens(content) for content in history]
+        total = sum(tokens) + reserve
+        if total <= self.token_budget:
+            return
+
+        cut = 0
+        while cut < len(history) and total > self.token_budget:
+            # 以使用者發言為界，確保保留的歷史紀錄從使用者開始
+            total -= tokens[cut]
+            cut += 1
+            while cut < len(history) and _content_role(history[cut]) != "user":
+                total -= tokens[cut]
+                cut += 1
+        kept = history[cut:]
+        if self.summarize and cut:
+            kept = self._summary(history[:cut]) + kept
+        print(f"對話 {entry.user_id} 超過 token 預算，移除 {cut} 則舊紀錄")
+        entry.session = self.model.start_chat(history=kept)
+
+    def _summary(self, history) -> list:
+        """
+        將舊對話摘要成一組對話，摘要失敗時回傳空列表（直接刪除舊對話）。
+        """
+        transcript = "\n".join(
+            f"{_content_role(content)}: {' '.join(_part_text(part) or '[圖片]' for part in _content_parts(content))}"
+            for content in history
+        )
+        try:
+            response = self.model.generate_content(f"請用幾句話摘要以下對話的重點，供之後的對話參考：\n{transcript}")
+            summary = response.text
+        except Exception as e:
+            print(f"摘要舊對話失敗：{e}")
+            return []
+        return [{"role": "user", "parts": [f"（先前對話摘要）{summary}"]},
+                {"role": "model", "parts": ["好的，我會參考先前的對話。"]}]
+
+    def _snapshot_path(self, user_id: str):
+        if not self.snapshot_dir:
+            return None
+        return os.path.join(self.snapshot_dir, hashlib.sha256(user_id.encode("utf-8")).hexdigest() + ".json")
+
+    def save(self, entry: ChatSessionEntry):
+        """
+        將 session 的文字歷史紀錄寫入磁碟（圖片不保存）。呼叫者需持有 entry.lock。
+        已清除或淘汰的 session 不會寫入。
+        :raises OSError: 寫入失敗
+        """
+        path = self._snapshot_path(entry.user_id)
+        if not path or entry.closed:
+            return
+        history = []
+        for content in entry.session.history:
+            texts = [text for text in (_part_text(part) for part in _content_parts(content)) if text]
+            history.append({"role": _content_role(content), "parts": texts or ["[圖片]"]})
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(history, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def _load(self, user_id: str) -> list:
+        path = self._snapshot_path(user_id)
+        if not path or not os.path.exists(path):
+            return []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"讀取對話紀錄失敗：{e}")
+            return []
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions,
+                    "token_budget": self.token_budget}
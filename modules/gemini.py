@@ -2,6 +2,7 @@ import os.path
 
 from modules.config import config
 from modules import tmdb
+from modules.chat_sessions import ChatSessionStore, estimate_tokens, IMAGE_TOKENS
 
 import PIL.Image
 import google.generativeai as genai
@@ -43,36 +44,56 @@ chat_model = genai.GenerativeModel(
 )
 
 
-chat_session = chat_model.start_chat(history=[])
+# 沒有使用者 ID 時（例如舊的呼叫方式）共用的對話
+DEFAULT_USER = "default"
+
+# 每個使用者各自的對話，歷史紀錄的 token 數有上限，每次對話送出的內容不會無限增長
+chat_sessions = ChatSessionStore(
+    chat_model,
+    max_sessions=config.getint("GeminiSessions", "MAX_SESSIONS", fallback=1000),
+    token_budget=config.getint("GeminiSessions", "TOKEN_BUDGET", fallback=8000),
+    snapshot_dir=config.get("GeminiSessions", "SNAPSHOT_DIR", fallback="") or None,
+    summarize=config.getboolean("GeminiSessions", "SUMMARIZE", fallback=False),
+)
 
 
-def chat(user_input: str, uploaded_images: list[str] = None) -> str:
+def chat(user_input: str, uploaded_images: list[str] = None, user_id: str = DEFAULT_USER) -> str:
     """
     與有記憶的 Gemini 對話。
     :param user_input: 使用者輸入的文字，不可以是 None
     :param uploaded_images: 使用者上傳的圖片，可以是 None
+    :param user_id: 使用者 ID，每個使用者有各自的對話紀錄
     :return: Gemini 的回應
     """
+    reserve = estimate_tokens(user_input)
     if uploaded_images:
         uploaded_images = [PIL.Image.open(image_path) for image_path in uploaded_images]
+        reserve += IMAGE_TOKENS * len(uploaded_images)
         user_input = [user_input] + uploaded_images
-    try:
-        response = chat_session.send_message(user_input)
-        print(f"Question: {user_input}")
-        print(f"Answer: {response.text}")
+    with chat_sessions.session(user_id) as entry:
+        chat_sessions.enforce_budget(entry, reserve)
+        try:
+            response = entry.session.send_message(user_input)
+            print(f"Question: {user_input}")
+            print(f"Answer: {response.text}")
+        except ValueError:
+            return response.prompt_feedback
+        except Exception as e:
+            return str(e)
+        # 寫入磁碟失敗不影響這次的回應
+        try:
+            chat_sessions.save(entry)
+        except OSError as e:
+            print(f"寫入對話紀錄失敗：{e}")
         return response.text
-    except ValueError:
-        return response.prompt_feedback
-    except Exception as e:
-        return str(e)
 
 
-def new_chat():
+def new_chat(user_id: str = DEFAULT_USER):
     """
-    開始新的對話。
+    開始新的對話，只清除該使用者的對話紀錄。
+    :param user_id: 使用者 ID，與 chat 的 user_id 相同
     """
-    global chat_session
-    chat_session = chat_model.start_chat(history=[])
+    chat_sessions.reset(user_id)
 
 
 ####################################################################################################
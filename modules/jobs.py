@@ -0,0 +1,228 @@
+"""
+背景工作佇列。
+
+字幕工作（擷取音訊、Whisper 轉錄、翻譯、FFmpeg 燒錄）很耗時，不適合在 HTTP 請求中執行。
+端點只負責把工作放進佇列並回傳 job ID，由固定數量的背景執行緒依序處理，
+前端再透過 job ID 查詢目前階段、進度與結果網址，或訂閱工作事件（例如逐段產生的字幕）。
+"""
+
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+
+from modules.config import config
+
+# 每個工作最多保留的事件數，超過時捨棄最舊的事件（訂閱者從仍保留的第一個事件繼續）
+MAX_EVENTS = config.getint("Jobs", "MAX_EVENTS", fallback=5000)
+# 工作結束後只保留最後幾個事件（最終狀態與結束事件），完成的工作不再佔用字幕事件的記憶體
+FINISHED_EVENTS = 2
+# 工作結束後仍保留所有事件的時間（秒），讓較晚訂閱或斷線重連的前端能取得完整字幕
+FINISHED_EVENTS_TTL = config.getfloat("Jobs", "FINISHED_EVENTS_TTL", fallback=600)
+
+
+class Job:
+    """
+    單一背景工作的狀態。
+    """
+    __slots__ = ("id", "status", "stage", "progress", "result_url", "error", "created_at", "updated_at",
+                 "events", "_first_event", "_condition")
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = Job.QUEUED
+        self.stage = "排隊中"
+        self.progress = 0
+        self.result_url = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.events = []
+        # events[0] 的事件序號，前面的事件已被捨棄
+        self._first_event = 0
+        self._condition = threading.Condition()
+
+    def update(self, stage: str, progress: int):
+        """
+        更新目前階段與完成百分比。
+        :param stage: 階段名稱
+        :param progress: 完成百分比 (0~100)
+        """
+        self.stage = stage
+        self.progress = max(0, min(100, int(progress)))
+        self.updated_at = time.time()
+        self.publish("status", {"stage": self.stage, "progress": self.progress})
+
+    def publish(self, event: str, data: dict):
+        """
+        發布工作事件給訂閱者。
+        :param event: 事件名稱，例如 "status", "cue", "done", "error"
+        :param data: 事件內容
+        """
+        with self._condition:
+            self.events.append((event, data))
+            self._trim_events(MAX_EVENTS)
+            self._condition.notify_all()
+
+    def _trim_events(self, limit: int):
+        # 呼叫者需持有 self._condition
+        excess = len(self.events) - limit
+        if excess > 0:
+            del self.events[:excess]
+            self._first_event += excess
+
+    def finish(self, status: str, event: str, data: dict):
+        """
+        設定最終狀態並發布最後一個事件，兩者同時生效，訂閱者不會漏掉結束事件。
+        事件在 FINISHED_EVENTS_TTL 內仍完整保留，之後由 JobQueue 呼叫 release_events 釋放。
+        """
+        with self._condition:
+            self.status = status
+            self.events.append((event, data))
+            self._trim_events(MAX_EVENTS)
+            self._condition.notify_all()
+
+    def release_events(self):
+        """
+        工作結束一段時間後，只保留最後的結束事件，釋放逐段字幕等事件的記憶體。
+        """
+        with self._condition:
+            self._trim_events(FINISHED_EVENTS)
+
+    def finished(self) -> bool:
+        return self.status in (Job.DONE, Job.FAILED)
+
+    def iter_events(self, start: int = 0, timeout: float = 15):
+        """
+        依序取得工作事件，沒有新事件時等待；工作結束且事件取完後停止。
+        等待超過 timeout 秒時產生 (序號, None, None)，讓呼叫者可以送出 keep-alive。
+        :param start: 從第幾個事件開始；已被捨棄的事件會略過
+        :return: (事件序號, 事件名稱, 事件內容) 的 generator
+        """
+        position = start
+        while True:
+            with self._condition:
+                if position >= self._first_event + len(self.events) and not self.finished():
+                    self._condition.wait(timeout)
+                position = max(position, self._first_event)
+                pending = self.events[position - self._first_event:]
+                finished = self.finished()
+            if not pending:
+                if finished:
+                    return
+                yield position, None, None
+                continue
+            for event, data in pending:
+                position += 1
+                yield position, event, data
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "result_url": self.result_url,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers: int = 2, max_queue: int = 16, max_history: int = 1000):
+        """
+        :param workers: 背景執行緒數量
+        :param max_queue: 等待中的工作上限，超過時 submit 會丟出 queue.Full
+        :param max_history: 最多保留多少筆工作狀態供查詢
+        """
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._max_history = max_history
+        self._threads = []
+        # 依結束順序排列的 (結束時間, Job)，超過 FINISHED_EVENTS_TTL 後釋放事件
+        self._finished = deque()
+
+    def submit(self, func, *args, result_url: str = None) -> Job:
+        """
+        將工作放進佇列。
+        :param func: 工作函數，第一個參數為 Job，可用來回報進度
+        :param args: 傳給工作函數的其他參數
+        :param result_url: 工作完成後的結果網址
+        :return: Job
+        :raises queue.Full: 佇列已滿
+        """
+        self._start_workers()
+        job = Job()
+        self._queue.put_nowait((job, func, args, result_url))
+        self._release_finished()
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._max_history:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str):
+        """
+        依照 job ID 取得工作，找不到時回傳 None。
+        """
+        self._release_finished()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _release_finished(self):
+        expired = []
+        deadline = time.time() - FINISHED_EVENTS_TTL
+        with self._lock:
+            while self._finished and self._finished[0][0] <= deadline:
+                expired.append(self._finished.popleft()[1])
+        for job in expired:
+            job.release_events()
+
+    def depth(self) -> int:
+        """
+        目前等待中的工作數量。
+        """
+        return self._queue.qsize()
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            job, func, args, result_url = self._queue.get()
+            job.status = Job.RUNNING
+            job.update("開始處理", 0)
+            try:
+                func(job, *args)
+                job.result_url = result_url
+                job.update("完成", 100)
+                job.finish(Job.DONE, "done", {"result_url": result_url})
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                job.update("失敗", job.progress)
+                job.finish(Job.FAILED, "error", {"error": job.error})
+            finally:
+                with self._lock:
+                    self._finished.append((time.time(), job))
+                self._queue.task_done()
+
+
+job_queue = JobQueue(
+    workers=config.getint("Jobs", "WORKERS", fallback=2),
+    max_queue=config.getint("Jobs", "MAX_QUEUE", fallback=16),
+)
@@ -0,0 +1,137 @@
+"""
+本機語言偵測。
+
+先依 Unicode 字元區段判斷文字（中日韓、假名、諺文、西里爾字母等），拉丁字母的語言再以
+字元三連字 (trigram) 的小型模型判斷。回傳的語言代碼與 Azure 翻譯使用的代碼相同，
+信心不足時才交給 Azure 偵測，省下翻譯前的 detect_language 請求。
+"""
+
+import re
+
+# 繁體與簡體中文各自獨有的常用字（兩個字串逐字對應），用來區分 zh-Hant 與 zh-Hans
+TRADITIONAL_CHARS = ("們這個來說時為會對麼發學問後過經還從種樣點開關動現實體長國電話與歡單義頭處應當讓認進"
+                     "書車見東門馬魚鳥愛聽寫買賣歲錢視節樂觀導劇場華級紅結給無雖讀語論誰圖畫"
+                     "復聯戰爭俠銀護衛隊龍鳳劍記傳夢戀貓獅靈變剛鐵鋼偵殺風雲飛雞環遊園寶貝總員婦漢煙熱終極絕險億萬島軍師諸羅")
+SIMPLIFIED_CHARS = ("们这个来说时为会对么发学问后过经还从种样点开关动现实体长国电话与欢单义头处应当让认进"
+                    "书车见东门马鱼鸟爱听写买卖岁钱视节乐观导剧场华级红结给无虽读语论谁图画"
+                    "复联战争侠银护卫队龙凤剑记传梦恋猫狮灵变刚铁钢侦杀风云飞鸡环游园宝贝总员妇汉烟热终极绝险亿万岛军师诸罗")
+TRADITIONAL_ONLY = set(TRADITIONAL_CHARS)
+SIMPLIFIED_ONLY = set(SIMPLIFIED_CHARS)
+# 簡體字轉繁體字的對照表，供 str.translate 使用
+SIMPLIFIED_TO_TRADITIONAL = str.maketrans(SIMPLIFIED_CHARS, TRADITIONAL_CHARS)
+
+# 其他文字：(正規表示式, 語言代碼, 信心)
+SCRIPTS = (
+    (re.compile(r"[Ѐ-ӿ]"), "ru", 0.7),
+    (re.compile(r"[฀-๿]"), "th", 0.95),
+    (re.compile(r"[؀-ۿ]"), "ar", 0.8),
+    (re.compile(r"[֐-׿]"), "he", 0.9),
+    (re.compile(r"[ऀ-ॿ]"), "hi", 0.8),
+    (re.compile(r"[Ͱ-Ͽ]"), "el", 0.95),
+)
+
+HAN = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+KANA = re.compile(r"[぀-ヿㇰ-ㇿ]")
+HANGUL = re.compile(r"[가-힯ᄀ-ᇿ㄰-㆏]")
+LATIN = re.compile(r"[a-zà-öø-ÿ]+")
+
+# 各語言最常見的 trigram，依頻率由高到低（"_" 代表詞首或詞尾）
+TRIGRAM_PROFILES = {
+    "en": "_th the he_ and _an nd_ ing _of of_ ed_ _to to_ ion _in in_ er_ ent is_ _is hat tha for _fo re_ es_ ng_ "
+          "it_ _it was _wa _be his _hi you _yo",
+    "fr": "es_ _de de_ le_ _le ent re_ _la la_ nt_ ion les _et et_ que _qu ue_ des _co e_d ne_ est _pa on_ our ous "
+          "_un une _pl ais _pa _po pas",
+    "de": "en_ er_ ich ein der _de die _di sch ie_ ch_ und _un nd_ cht che _ei den gen ine _ge te_ ter ung es_ "
+          "ist _is _da das nic _ni",
+    "es": "_de de_ os_ la_ _la es_ _qu que ue_ el_ _el as_ _en en_ ent ado _co con on_ _lo los ión _pe par ra_ "
+          "_es est una _un por _po",
+    "it": "_di di_ la_ che _ch re_ _il il_ to_ ell lla _de del one _la no_ ent e_d ion are _co per _pe zio "
+          "tta sta ato _un gli _gl",
+    "pt": "_de de_ os_ do_ _qu que ue_ ão_ ção as_ _co com ent _pa nte es_ _da da_ um_ _um ar_ men _se não _nã "
+          "ra_ est par mos uma",
+    "nl": "en_ _de de_ an_ het _he et_ van _va ij_ _ee een _en nd_ er_ ter _ge gen oor ver _ve _in in_ _is "
+          "is_ _da dat _ni nie _wa",
+}
+
+_PROFILE_WEIGHTS = {
+    language: {trigram.replace("_", " "): len(trigrams.split()) - rank
+               for rank, trigram in enumerate(trigrams.split())}
+    for language, trigrams in TRIGRAM_PROFILES.items()
+}
+
+# 拉丁字母文字至少要有這麼多個 trigram 才會給出完整信心
+FULL_CONFIDENCE_TRIGRAMS = 40
+
+
+def _detect_latin(text: str) -> tuple[str, float]:
+    counts = {}
+    total = 0
+    for word in LATIN.findall(text.lower()):
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            trigram = padded[i:i + 3]
+            total += 1
+            for language, weights in _PROFILE_WEIGHTS.items():
+                weight = weights.get(trigram)
+                if weight:
+                    counts[language] = counts.get(language, 0) + weight
+    if not counts:
+        return "und", 0.0
+    ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    best_language, best = ranked[0]
+    second = ranked[1][1] if len(ranked) > 1 else 0
+    confidence = (1 - second / best) * min(1.0, total / FULL_CONFIDENCE_TRIGRAMS)
+    # 差距足夠大時，短文字也可以有一定的信心
+    return best_language, min(1.0, confidence * 2)
+
+
+def detect(text: str) -> tuple[str, float]:
+    """
+    偵測文字的語言。
+    :param text: 要偵測的文字
+    :return: (語言代碼, 信心 0~1)；無法判斷時為 ("und", 0.0)
+    """
+    if not text or not text.strip():
+        return "und", 0.0
+
+    han = len(HAN.findall(text))
+    kana = len(KANA.findall(text))
+    hangul = len(HANGUL.findall(text))
+    letters = sum(1 for char in text if char.isalpha())
+    if not letters:
+        return "und", 0.0
+
+    if kana and kana + han >= letters * 0.3:
+        return "ja", min(1.0, 0.6 + kana / (kana + han) * 2)
+    if hangul and hangul >= letters * 0.3:
+        return "ko", hangul / letters
+    if han and han >= letters * 0.3:
+        traditional = sum(1 for char in text if char in TRADITIONAL_ONLY)
+        simplified = sum(1 for char in text if char in SIMPLIFIED_ONLY)
+        # 是中文的信心依漢字比例；沒有繁簡獨有的字時無法區分，回傳 "zh"
+        confidence = min(1.0, han / letters + 0.3)
+        if simplified == traditional:
+            return "zh", confidence
+        return ("zh-Hans" if simplified > traditional else "zh-Hant"), confidence
+
+    for pattern, language, confidence in SCRIPTS:
+        if len(pattern.findall(text)) >= letters * 0.5:
+            return language, confidence
+
+    return _detect_latin(text)
+
+
+def is_chinese(language: str) -> bool:
+    return language in ("zh", "zh-Hant", "zh-Hans")
+
+
+def detect_language(text: str, threshold: float = 0.8, fallback=None) -> str:
+    """
+    偵測語言，信心低於 threshold 時呼叫 fallback（例如 Azure 偵測）。
+    :param fallback: 給定文字並回傳語言代碼的函數；None 時回傳本機偵測的結果
+    :return: 語言代碼
+    """
+    language, confidence = detect(text)
+    if confidence >= threshold or fallback is None:
+        return language
+    return fallback(text)
@@ -107,6 +107,9 @@ CommandHandlers: dict = {
 }
 
 
+# 清除自己與 Gemini 的對話紀錄的指令（@新對話）
+NEW_CHAT_COMMAND = "新對話"
+
 # default chat mode
 chat_mode = ChatMode.GEMINI
 
@@ -121,7 +124,7 @@ def handle_text_message(event, text = None) -> None:
     r"""
     處理文字訊息的函數。
 
-    當文字訊息為指令時，會切換聊天模式，並刪除所有已上傳的圖片。
+    當文字訊息為指令時，會切換聊天模式，並刪除所有已上傳的圖片；@新對話 則清除該使用者與 Gemini 的對話紀錄。
 
     當文字訊息不是指令時，會根據目前聊天模式取得對應的處理函數並進行回應。
     """
@@ -129,8 +132,13 @@ def handle_text_message(event, text = None) -> None:
     text = text if text else event.message.text
     result = ""
 
+    # start a new Gemini chat for this user
+    if text == "@" + NEW_CHAT_COMMAND:
+        gemini.new_chat(event.source.user_id)
+        result = "已開始新的對話"
+
     # text is a command
-    if text.startswith("@"):
+    elif text.startswith("@"):
         cmd = text[1:]
         try:
             new_chat_mode = ChatMode(cmd)
@@ -149,7 +157,7 @@ def handle_text_message(event, text = None) -> None:
     # text is not a command
     else:
         if chat_mode == ChatMode.GEMINI:
-            result = gemini.chat(text, uploaded_images=uploaded_images)
+            result = gemini.chat(text, uploaded_images=uploaded_images, user_id=event.source.user_id)
         else:
             result = command_handler(text)
 
@@ -0,0 +1,52 @@
+"""
+影片傳送。
+
+支援 HTTP Range (206)、ETag 與條件式 GET，讓瀏覽器播放與拖曳進度時只讀取需要的部分；
+在反向代理後面時可以改由 X-Accel-Redirect (nginx) 或 X-Sendfile 直接傳送檔案，不經過 Python。
+輸出檔名只由處理參數決定，重新產生時內容可能改變，所以一律以 ETag 重新驗證，未變更時回傳 304。
+"""
+
+import mimetypes
+import os
+
+from flask import send_from_directory, make_response, abort
+from werkzeug.security import safe_join
+
+from modules.config import config
+
+# nginx internal location 的前綴，例如 /protected-uploads/；留空表示不使用 X-Accel-Redirect
+X_ACCEL_PREFIX = config.get("Media", "X_ACCEL_PREFIX", fallback="")
+
+
+def send_media(directory: str, filename: str, as_attachment: bool = False):
+    """
+    傳送 directory 中的檔案，支援 Range、ETag 與條件式 GET。
+    :param directory: 檔案所在資料夾
+    :param filename: 檔案名稱
+    :param as_attachment: 是否以下載方式傳送
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    if X_ACCEL_PREFIX:
+        # 交給 nginx 傳送檔案，Range 與條件式請求也由 nginx 處理
+        response = make_response("")
+        response.headers["X-Accel-Redirect"] = X_ACCEL_PREFIX.rstrip("/") + "/" + filename
+        response.headers["Content-Type"] = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if as_attachment:
+            response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    else:
+        # conditional=True 會處理 Range / If-Range / If-None-Match / If-Modified-Since，
+        # 並透過 WSGI server 的 file_wrapper (sendfile) 或 USE_X_SENDFILE 傳送
+        response = send_from_directory(
+            directory, filename,
+            as_attachment=as_attachment,
+            conditional=True,
+            etag=True,
+        )
+
+    response.headers["Accept-Ranges"] = "bytes"
+    # 瀏覽器可以保存檔案，但每次使用前都要以 ETag 重新驗證
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,171 @@
+"""
+Whisper 模型註冊表。
+
+每個模型大小在同一個 process 中只載入一次，之後的字幕工作直接重用已載入的模型。
+已載入的模型依照 LRU 順序管理，超過記憶體預算或閒置太久的模型會被釋放。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from modules.config import config
+
+
+class LoadedModel:
+    """
+    已載入模型的紀錄：模型本體、載入耗時與常駐記憶體大小。
+    """
+    __slots__ = ("name", "model", "load_seconds", "resident_bytes", "last_used")
+
+    def __init__(self, name, model, load_seconds, resident_bytes):
+        self.name = name
+        self.model = model
+        self.load_seconds = load_seconds
+        self.resident_bytes = resident_bytes
+        self.last_used = time.monotonic()
+
+
+def _model_resident_bytes(name: str, model) -> int:
+    """
+    估算 PyTorch 模型權重佔用的記憶體大小（參數與 buffer）；沒有參數的模型（例如 CTranslate2）為 0。
+    """
+    total = 0
+    for tensors in (getattr(model, "parameters", None), getattr(model, "buffers", None)):
+        if tensors is None:
+            continue
+        for tensor in tensors():
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelRegistry:
+    def __init__(self, loader, memory_budget_mb: int = 0, idle_timeout: float = 0, sizer=_model_resident_bytes):
+        """
+        :param loader: 給定模型名稱並回傳模型物件的函數
+        :param sizer: 給定模型名稱與模型物件並回傳常駐記憶體大小的函數，記憶體預算依此計算
+        :param memory_budget_mb: 所有常駐模型的記憶體上限 (MB)，0 表示不限制
+        :param idle_timeout: 模型閒置多少秒後釋放，0 表示不釋放
+        """
+        self._loader = loader
+        self._sizer = sizer
+        self._memory_budget = memory_budget_mb * 1024 * 1024
+        self._idle_timeout = idle_timeout
+        self._models: OrderedDict[str, LoadedModel] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+
+    def get(self, name: str):
+        """
+        取得模型，若尚未載入則載入一次並放入註冊表。
+        :param name: 模型名稱，例如 "tiny", "base", "small"
+        :return: 模型物件
+        """
+        self.evict_idle()
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                self._models.move_to_end(name)
+                return entry.model
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # 同一個模型同時只會有一個執行緒在載入，其他執行緒等待載入完成
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(name)
+                if entry is not None:
+                    entry.last_used = time.monotonic()
+                    self._models.move_to_end(name)
+                    return entry.model
+
+            print(f"正在載入 Whisper 模型 {name}...")
+            start = time.perf_counter()
+            model = self._loader(name)
+            load_seconds = time.perf_counter() - start
+            entry = LoadedModel(name, model, load_seconds, self._sizer(name, model))
+            print(f"模型 {name} 載入完成，耗時 {load_seconds:.2f} 秒，"
+                  f"常駐記憶體 {entry.resident_bytes / 1024 / 1024:.1f} MB")
+
+            with self._lock:
+                self._models[name] = entry
+                self._evict_over_budget(keep=name)
+            return model
+
+    def preload(self, name: str, background: bool = True):
+        """
+        預先載入模型，讓第一個字幕工作不必等待模型載入。
+        :param name: 模型名稱
+        :param background: 是否在背景執行緒中載入
+        """
+        if not background:
+            self.get(name)
+            return None
+        thread = threading.Thread(target=self.get, args=(name,), name=f"whisper-preload-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def evict_idle(self):
+        """
+        釋放閒置超過 idle_timeout 的模型。
+        """
+        if not self._idle_timeout:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for name in [name for name, entry in self._models.items()
+                         if now - entry.last_used > self._idle_timeout]:
+                self._evict(name, "閒置過久")
+
+    def _evict_over_budget(self, keep: str):
+        # 呼叫者需持有 self._lock
+        if not self._memory_budget:
+            return
+        for name in list(self._models):
+            if self._resident_bytes() <= self._memory_budget:
+                break
+            if name != keep:
+                self._evict(name, "超過記憶體預算")
+
+    def _evict(self, name: str, reason: str):
+        # 呼叫者需持有 self._lock
+        entry = self._models.pop(name, None)
+        if entry is not None:
+            print(f"釋放 Whisper 模型 {name}（{reason}）")
+
+    def _resident_bytes(self) -> int:
+        return sum(entry.resident_bytes for entry in self._models.values())
+
+    def stats(self) -> dict:
+        """
+        回傳目前已載入模型的載入耗時與常駐記憶體大小。
+        """
+        with self._lock:
+            return {
+                "resident_bytes": self._resident_bytes(),
+                "memory_budget_bytes": self._memory_budget,
+                "models": {
+                    name: {
+                        "load_seconds": round(entry.load_seconds, 3),
+                        "resident_bytes": entry.resident_bytes,
+                        "idle_seconds": round(time.monotonic() - entry.last_used, 1),
+                    }
+                    for name, entry in self._models.items()
+                },
+            }
+
+
+def _load_whisper_model(name: str):
+    import whisper
+    return whisper.load_model(name)
+
+
+# 預設使用的模型大小，可選 "tiny", "base", "small", "medium", "large"
+default_model_size = config.get("Whisper", "MODEL_SIZE", fallback="base")
+
+whisper_models = ModelRegistry(
+    _load_whisper_model,
+    memory_budget_mb=config.getint("Whisper", "MEMORY_BUDGET_MB", fallback=0),
+    idle_timeout=config.getfloat("Whisper", "IDLE_TIMEOUT", fallback=0),
+)
+
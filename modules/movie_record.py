@@ -0,0 +1,152 @@
+"""
+電影資料模型。
+
+MovieRecord 只保存 TMDB 回應中用得到的部分，各區段（詳細資訊、評論）在第一次使用時才載入；
+FetchProfile 決定向 TMDB 要求哪些附加資料、要幾則評論、是否做情感分析，
+每個呼叫者只取得並翻譯自己需要的欄位。輸出格式由 modules.movie_render 負責。
+"""
+
+from datetime import datetime
+
+
+class FetchProfile:
+    """
+    查詢設定：append_to_response 的附加資料、評論數量與是否分析評論情感。
+    """
+    __slots__ = ("name", "append", "reviews", "sentiment")
+
+    def __init__(self, name: str, append: tuple = (), reviews: int = 0, sentiment: bool = False):
+        self.name = name
+        self.append = append
+        self.reviews = reviews
+        self.sentiment = sentiment
+
+
+# 別名與翻譯片名，詳細資訊載入時會加入本機電影名稱索引 (modules.title_index)；
+# overview 維持不附加資料，索引由 card、full 與預熱的查詢補充
+TITLE_APPEND = ("alternative_titles", "translations")
+
+FETCH_PROFILES = {
+    # 只需要劇情簡介，例如猜電影
+    "overview": FetchProfile("overview"),
+    # 預設的電影資訊回覆：導演、主演與前三則評論
+    "card": FetchProfile("card", append=("credits",) + TITLE_APPEND, reviews=3, sentiment=True),
+    # 所有附加資料
+    "full": FetchProfile("full", append=("credits", "releases", "keywords", "alternative_titles",
+                                         "translations", "external_ids"), reviews=3, sentiment=True),
+}
+
+
+def fetch_profile(profile) -> FetchProfile:
+    """
+    :param profile: FetchProfile 或 FETCH_PROFILES 中的名稱
+    """
+    return profile if isinstance(profile, FetchProfile) else FETCH_PROFILES[profile]
+
+
+STATUS_MAPPING = {
+    'Released': '已上映',
+    'Upcoming': '即將上映',
+    'In Production': '製作中',
+    'Canceled': '已取消'
+}
+
+
+class MovieRecord:
+    """
+    一部電影的資料。details 與 reviews 在第一次使用時透過 loader 載入，也可以由 loader 預先同時載入。
+    :param loader: 提供 load_details(movie_id, profile) 與 load_reviews(movie_id, profile) 的物件，
+                   例如 modules.tmdb.MovieSearch
+    """
+    __slots__ = ("movie_id", "profile", "_loader", "_details", "_reviews")
+
+    def __init__(self, movie_id: int, profile, loader, details: dict = None, reviews: list = None):
+        self.movie_id = movie_id
+        self.profile = fetch_profile(profile)
+        self._loader = loader
+        self._details = details
+        self._reviews = reviews
+
+    @property
+    def details(self) -> dict:
+        if self._details is None:
+            self._details = self._loader.load_details(self.movie_id, self.profile)
+        return self._details
+
+    @property
+    def reviews(self) -> list:
+        """
+        評論列表，每則為 {"id", "author", "content", "rating", "sentiment"}，
+        rating 沒有時為 "無"，sentiment 未分析或逾時時為 None
+        """
+        if self._reviews is None:
+            self._reviews = self._loader.load_reviews(self.movie_id, self.profile) if self.profile.reviews else []
+        return self._reviews
+
+    @property
+    def title(self) -> str:
+        return self.details.get('title', '')
+
+    @property
+    def overview(self) -> str:
+        return self.details.get('overview', '')
+
+    @property
+    def original_language(self) -> str:
+        return self.details.get('original_language', '無資訊')
+
+    @property
+    def vote_average(self):
+        return self.details.get('vote_average', 0)
+
+    @property
+    def vote_count(self):
+        return self.details.get('vote_count', 0)
+
+    @property
+    def release_date(self):
+        """
+        上映日期，沒有資料時為 None
+        """
+        value = self.details.get('release_date')
+        return datetime.strptime(value, "%Y-%m-%d") if value else None
+
+    @property
+    def status(self) -> str:
+        return STATUS_MAPPING.get(self.details.get('status', ''), '未知')
+
+    @property
+    def directors(self) -> list[str]:
+        return [crew['name'] for crew in self.details.get('credits', {}).get('crew', [])
+                if crew['job'] == 'Director']
+
+    def cast(self, limit: int = 3) -> list[str]:
+        return [actor['name'] for actor in self.details.get('credits', {}).get('cast', [])[:limit]]
+
+    @property
+    def genres(self) -> list[str]:
+        return [genre['name'] for genre in self.details.get('genres', [])]
+
+    @property
+    def production_countries(self) -> list[str]:
+        return [country['name'] for country in self.details.get('production_countries', [])]
+
+    @property
+    def production_companies(self) -> list[str]:
+        return [company['name'] for company in self.details.get('production_companies', [])]
+
+    @property
+    def spoken_languages(self) -> list[str]:
+        return [lang['name'] for lang in self.details.get('spoken_languages', [])]
+
+    @property
+    def keywords(self) -> list[str]:
+        return [keyword['name'] for keyword in self.details.get('keywords', {}).get('keywords', [])]
+
+    @property
+    def budget(self) -> int:
+        return self.details.get('budget', 0)
+
+    @property
+    def revenue(self) -> int:
+        return self.details.get('revenue', 0)
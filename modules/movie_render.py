@@ -0,0 +1,111 @@
+"""
+電影資訊的輸出格式。
+
+- render_card：LINE / 網頁的電影資訊回覆。
+- render_overview：只有劇情簡介。
+- render_prompt：給 Gemini 的精簡文字，沒有表情符號與空欄位，減少 prompt token。
+"""
+
+from modules.movie_record import MovieRecord
+
+
+def _join(items) -> str:
+    return "、".join(items) if items else "無資訊"
+
+
+def _format_date(record: MovieRecord) -> str:
+    # 取得上映年份的中文格式
+    release_date = record.release_date
+    return release_date.strftime("%Y年%m月%d日") if release_date else "無資訊"
+
+
+def render_reviews(record: MovieRecord) -> str:
+    """
+    電影評論段落，評論與情感分析已在載入時完成
+    """
+    if not record.reviews:
+        return "🎬 電影評價: 這部電影還沒有人評論\n"
+    reviews_section = "🎬 電影評價:\n"
+    for idx, review in enumerate(record.reviews, 1):
+        reviews_section += f"評論 {idx}:\n"
+        reviews_section += f"👤 作者: {review['author']}\n"
+        if review['rating'] != '無':
+            reviews_section += f"⭐ 評分: {review['rating']}/10\n"
+        reviews_section += f"💬 內容: {review['content']}\n"
+        if review['sentiment']:
+            reviews_section += f"分析結果：{review['sentiment']}\n"
+        reviews_section += "\n"
+    return reviews_section
+
+
+def render_card(record: MovieRecord) -> str:
+    """
+    電影資訊回覆
+    """
+    directors = record.directors
+    return f"""🎬 電影基本資訊:
+📝 電影名稱: {record.title}
+🌍 原始語言: {record.original_language.upper()}
+⭐ 電影評分: {record.vote_average}/10
+
+📊 評價統計:
+🔢 總投票數: {record.vote_count} 票
+
+📅 上映資訊:
+🗓️ 上映日期: {_format_date(record)}
+📊 電影狀態: {record.status}
+
+👥 創作團隊:
+🎥 導演: {directors[0] if directors else "無資訊"}
+🌟 主演: {_join(record.cast())}
+
+🎭 電影類型: {_join(record.genres)}
+
+📍 製作資訊:
+🌐 製作國家: {_join(record.production_countries)}
+🏢 製片公司: {_join(record.production_companies)}
+🗣️ 電影語言: {_join(record.spoken_languages)}
+
+📖 劇情簡介:
+{record.overview}
+
+💰 財務資訊:
+💸 電影預算: ${record.budget:,} USD
+💰 全球票房: ${record.revenue:,} USD
+
+{render_reviews(record)}
+"""
+
+
+def render_overview(record: MovieRecord) -> str:
+    """
+    劇情簡介
+    """
+    return record.overview or '無劇情簡介'
+
+
+def render_prompt(record: MovieRecord) -> str:
+    """
+    給 Gemini 的精簡電影資訊，只輸出有資料的欄位
+    """
+    fields = [
+        ("名稱", record.title),
+        ("原始語言", record.original_language),
+        ("評分", f"{record.vote_average}/10（{record.vote_count} 票）"),
+        ("上映日期", _format_date(record) if record.release_date else ""),
+        ("狀態", record.status),
+        ("導演", "、".join(record.directors)),
+        ("主演", "、".join(record.cast(5))),
+        ("類型", "、".join(record.genres)),
+        ("製作國家", "、".join(record.production_countries)),
+        ("關鍵字", "、".join(record.keywords)),
+        ("預算", f"{record.budget:,} USD" if record.budget else ""),
+        ("票房", f"{record.revenue:,} USD" if record.revenue else ""),
+        ("簡介", record.overview),
+    ]
+    lines = [f"{name}：{value}" for name, value in fields if value]
+    for idx, review in enumerate(record.reviews, 1):
+        rating = f"，評分 {review['rating']}/10" if review['rating'] != '無' else ""
+        sentiment = f"，情感 {review['sentiment']}" if review['sentiment'] else ""
+        lines.append(f"評論 {idx}（{review['author']}{rating}{sentiment}）：{review['content']}")
+    return "\n".join(lines)
@@ -0,0 +1,148 @@
+"""
+熱門電影預熱。
+
+背景執行緒定期取得 TMDB 的熱門 (trending) 與上映中 (now playing) 電影，
+預先載入詳細資訊、翻譯評論並分析情感，寫入各層快取；新片上映時的查詢高峰可以直接使用快取。
+TMDB 與 Azure（評論翻譯、情感分析）的請求速度分別受每分鐘請求數上限限制，不會佔滿兩者的配額。
+"""
+
+import threading
+import time
+
+from modules.config import config
+from modules.movie_record import FETCH_PROFILES
+from modules.tmdb_client import tmdb_client
+from modules.tmdb import movie_searcher
+
+# 預熱一部電影的 TMDB 請求數：card 詳細資訊（含別名與翻譯片名，供名稱索引使用）與評論
+TMDB_REQUESTS_PER_MOVIE = 2
+# 預熱一部電影最多的 Azure 請求數：每則評論一次翻譯，加上一次批次情感分析（翻譯快取命中時較少）
+AZURE_REQUESTS_PER_MOVIE = FETCH_PROFILES["card"].reviews + 1
+# 每部電影的處理時間上限（秒）
+MOVIE_DEADLINE = 60
+
+
+class Prewarmer:
+    def __init__(self, searcher, interval: float = 3 * 3600, requests_per_minute: float = 20,
+                 max_movies: int = 40, region: str = "TW", azure_requests_per_minute: float = 10):
+        """
+        :param searcher: modules.tmdb.MovieSearch
+        :param interval: 每輪預熱的間隔（秒）
+        :param requests_per_minute: 預熱使用的 TMDB 每分鐘請求數上限
+        :param azure_requests_per_minute: 預熱使用的 Azure 每分鐘請求數上限（翻譯與情感分析合計）
+        :param max_movies: 每輪最多預熱的電影數
+        :param region: 上映中電影的地區
+        """
+        self.searcher = searcher
+        self.interval = interval
+        self.requests_per_minute = requests_per_minute
+        self.azure_requests_per_minute = azure_requests_per_minute
+        self.max_movies = max_movies
+        self.region = region
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = None
+        self.warmed = 0
+        self.failed = 0
+
+    def popular_movie_ids(self) -> list[int]:
+        """
+        熱門與上映中電影的 ID，去除重複並依序保留前 max_movies 部。
+        列表本身不經過回應快取，每輪都取得最新的列表。
+        """
+        movie_ids = []
+        for path, params in (("/trending/movie/day", {"language": "zh-TW"}),
+                             ("/movie/now_playing", {"language": "zh-TW", "region": self.region})):
+            try:
+                results = tmdb_client.get(path, **params).get("results", [])
+            except Exception as e:
+                print(f"取得預熱電影列表失敗：{path} {e}")
+                continue
+            self._throttle(1)
+            movie_ids.extend(movie["id"] for movie in results if movie["id"] not in movie_ids)
+        return movie_ids[:self.max_movies]
+
+    def warm(self, movie_id: int):
+        """
+        預熱一部電影：預設回覆需要的資料（詳細資訊、翻譯後的評論與情感分析）。
+        逾時仍未翻譯完的評論不會分析情感，翻譯完成後仍會寫入翻譯快取。
+        """
+        self.searcher.fetch(movie_id, "card", deadline=time.monotonic() + MOVIE_DEADLINE)
+
+    def run_once(self):
+        """
+        執行一輪預熱。
+        """
+        start = time.perf_counter()
+        movie_ids = self.popular_movie_ids()
+        warmed = 0
+        for movie_id in movie_ids:
+            if self._stop.is_set():
+                break
+            try:
+                self.warm(movie_id)
+                warmed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"預熱電影 {movie_id} 失敗：{e}")
+            self._throttle(TMDB_REQUESTS_PER_MOVIE, AZURE_REQUESTS_PER_MOVIE)
+        self.warmed += warmed
+        self.last_run = time.time()
+        print(f"已預熱 {warmed}/{len(movie_ids)} 部熱門電影，耗時 {time.perf_counter() - start:.1f} 秒")
+
+    def _throttle(self, requests: int, azure_requests: int = 0):
+        # 依 TMDB 與 Azure 各自的每分鐘請求數上限，等待兩者中較長的時間；停止時立即返回
+        delays = [0.0]
+        if self.requests_per_minute > 0:
+            delays.append(requests * 60 / self.requests_per_minute)
+        if self.azure_requests_per_minute > 0:
+            delays.append(azure_requests * 60 / self.azure_requests_per_minute)
+        if max(delays) > 0:
+            self._stop.wait(max(delays))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"預熱失敗：{e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """
+        在背景執行緒中開始定期預熱。
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="tmdb-prewarm", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {"last_run": self.last_run, "warmed": self.warmed, "failed": self.failed}
+
+
+_prewarmer = None
+
+
+def start_prewarmer():
+    """
+    若 config.ini 中 [Prewarm] ENABLED 為 true，啟動背景預熱。
+    :return: Prewarmer，未啟用時為 None
+    """
+    global _prewarmer
+    if not config.getboolean("Prewarm", "ENABLED", fallback=False):
+        return None
+    if _prewarmer is None:
+        _prewarmer = Prewarmer(
+            movie_searcher,
+            interval=config.getfloat("Prewarm", "INTERVAL", fallback=3 * 3600),
+            requests_per_minute=config.getfloat("Prewarm", "REQUESTS_PER_MINUTE", fallback=20),
+            max_movies=config.getint("Prewarm", "MAX_MOVIES", fallback=40),
+            region=config.get("Prewarm", "REGION", fallback="TW"),
+            azure_requests_per_minute=config.getfloat("Prewarm", "AZURE_REQUESTS_PER_MINUTE", fallback=10),
+        )
+    _prewarmer.start()
+    return _prewarmer
@@ -0,0 +1,102 @@
+"""
+評論情感分析。
+
+整個 process 共用一個 TextAnalyticsClient；同一部電影的評論在同一個 analyze_sentiment 請求中批次送出，
+分析過的結果以文字內容的雜湊與語言快取，同一段文字不會被分析第二次；
+同一則評論的文字改變（例如先以原文、之後以翻譯送出）時不會拿到舊的結果。
+意見探勘 (opinion mining) 預設關閉，只有需要時才開啟。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from azure.ai.textanalytics import TextAnalyticsClient
+from azure.core.credentials import AzureKeyCredential
+
+from modules.config import config
+
+# Azure 同步 analyze_sentiment 每個請求最多 10 份文件，每份最多 5120 個字元
+MAX_DOCUMENTS_PER_REQUEST = 10
+MAX_CHARS_PER_DOCUMENT = 5120
+
+
+class SentimentService:
+    def __init__(self, client, language: str = "zh-hant", cache_entries: int = 5000):
+        """
+        :param client: TextAnalyticsClient
+        :param language: 文件語言
+        :param cache_entries: 最多快取的文件數量
+        """
+        self.client = client
+        self.language = language
+        self._cache: OrderedDict[tuple, dict] = OrderedDict()
+        self._cache_entries = cache_entries
+        self._lock = threading.Lock()
+
+    def analyze(self, documents, opinion_mining: bool = False) -> list:
+        """
+        分析多份文件的情感，快取中沒有的文件才會送到 Azure，並以最少的請求數批次送出。
+        :param documents: (文件 ID, 文字) 列表，ID 通常是 TMDB 評論 ID，只用於記錄；快取以文字內容為鍵
+        :param opinion_mining: 是否同時探勘意見（每個句子的評論對象）
+        :return: 與 documents 對應的結果，每個為 {"sentiment": 整體標籤, "opinions": [(對象, 標籤)]}；
+                 分析失敗的文件為 None
+        """
+        results = [None] * len(documents)
+        keys = [self._cache_key(text, opinion_mining) for _, text in documents]
+        missing = []
+        with self._lock:
+            for index, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    results[index] = cached
+                else:
+                    missing.append(index)
+
+        for start in range(0, len(missing), MAX_DOCUMENTS_PER_REQUEST):
+            batch = missing[start:start + MAX_DOCUMENTS_PER_REQUEST]
+            response = self.client.analyze_sentiment(
+                [documents[index][1][:MAX_CHARS_PER_DOCUMENT] for index in batch],
+                show_opinion_mining=opinion_mining,
+                language=self.language,
+            )
+            for index, doc in zip(batch, response):
+                if doc.is_error:
+                    print(f"情感分析失敗：{documents[index][0]} {doc.error}")
+                    continue
+                result = {"sentiment": doc.sentiment, "opinions": []}
+                if opinion_mining:
+                    result["opinions"] = [(opinion.target.text, opinion.target.sentiment)
+                                          for sentence in doc.sentences
+                                          for opinion in sentence.mined_opinions]
+                results[index] = result
+                self._remember(keys[index], result)
+        return results
+
+    def _cache_key(self, text: str, opinion_mining: bool) -> tuple:
+        # 實際送出的文字（截斷後）與語言決定結果
+        return text_id(text[:MAX_CHARS_PER_DOCUMENT]), self.language, opinion_mining
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_entries:
+                self._cache.popitem(last=False)
+
+
+def text_id(text: str) -> str:
+    """
+    文字內容的雜湊，作為快取鍵或沒有評論 ID 時的文件 ID。
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+sentiment_service = SentimentService(
+    TextAnalyticsClient(
+        endpoint=config["AzureLanguage"]["END_POINT"],
+        credential=AzureKeyCredential(config["AzureLanguage"]["API_KEY"]),
+    ),
+    cache_entries=config.getint("AzureLanguage", "CACHE_ENTRIES", fallback=5000),
+)
@@ -0,0 +1,123 @@
+"""
+SRT 字幕解析與輸出。
+
+以 generator 逐段讀寫字幕，不需要把整個檔案保存成多份字串列表；
+每段字幕以 Cue 表示，翻譯時只需處理 Cue.text，序號與時間軸不會被翻譯內容破壞。
+"""
+
+import re
+
+TIMING_PATTERN = re.compile(
+    r"(\d+):(\d{2}):(\d{2})[,.](\d{1,3})\s*-+\s*>\s*(\d+):(\d{2}):(\d{2})[,.](\d{1,3})"
+)
+
+
+class Cue:
+    """
+    一段字幕：序號、開始與結束時間（毫秒）、字幕文字。
+    """
+    __slots__ = ("index", "start_ms", "end_ms", "text")
+
+    def __init__(self, index: int, start_ms: int, end_ms: int, text: str):
+        self.index = index
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.text = text
+
+    def with_text(self, text: str) -> "Cue":
+        """
+        回傳時間軸相同、文字不同的新 Cue。
+        """
+        return Cue(self.index, self.start_ms, self.end_ms, text)
+
+    def __repr__(self):
+        return f"Cue({self.index}, {self.start_ms}, {self.end_ms}, {self.text!r})"
+
+
+def seconds_to_ms(seconds: float) -> int:
+    return int(round(seconds * 1000))
+
+
+def format_timestamp_ms(ms: int) -> str:
+    """
+    格式化毫秒為 SRT 標準格式：hh:mm:ss,ms
+    """
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    secs, millis = divmod(ms, 1000)
+    return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
+
+
+def _timing_to_ms(hours, minutes, seconds, millis) -> int:
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis.ljust(3, "0"))
+
+
+def parse(lines):
+    """
+    逐段解析 SRT。可容忍 BOM、全形冒號、" - >" 等常見格式錯誤；沒有時間軸的段落會被略過。
+    :param lines: 可迭代的文字行，例如開啟中的檔案
+    :return: Cue 的 generator
+    """
+    index = None
+    timing = None
+    text_lines = []
+    count = 0
+    for line in lines:
+        line = line.strip().lstrip("\ufeff")
+        if not line:
+            if timing is not None:
+                count += 1
+                yield Cue(index or count, timing[0], timing[1], "\n".join(text_lines))
+            index, timing, text_lines = None, None, []
+            continue
+
+        if timing is None:
+            match = TIMING_PATTERN.search(line.replace("：", ":"))
+            if match:
+                groups = match.groups()
+                timing = (_timing_to_ms(*groups[:4]), _timing_to_ms(*groups[4:]))
+            elif line.isdigit() and index is None:
+                index = int(line)
+            continue
+
+        text_lines.append(line)
+
+    if timing is not None:
+        count += 1
+        yield Cue(index or count, timing[0], timing[1], "\n".join(text_lines))
+
+
+def compose(cues, renumber: bool = True):
+    """
+    逐段輸出 SRT 文字。
+    :param cues: 可迭代的 Cue
+    :param renumber: 是否從 1 開始重新編號
+    :return: 每段字幕文字的 generator
+    """
+    for number, cue in enumerate(cues, 1):
+        index = number if renumber else cue.index
+        yield f"{index}\n{format_timestamp_ms(cue.start_ms)} --> {format_timestamp_ms(cue.end_ms)}\n{cue.text}\n\n"
+
+
+def read(path: str):
+    """
+    逐段讀取 SRT 檔案。
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        yield from parse(f)
+
+
+def write(cues, path: str):
+    """
+    逐段寫入 SRT 檔案。
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(compose(cues))
+
+
+def from_segments(segments):
+    """
+    將 Whisper 的 segments（含 start, end, text）轉成 Cue。
+    """
+    for i, segment in enumerate(segments, 1):
+        yield Cue(i, seconds_to_ms(segment["start"]), seconds_to_ms(segment["end"]), segment["text"].strip())
@@ -1,11 +1,102 @@
-import whisper
 import subprocess
 import os
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
-def embed_subtitles(workdir, input_video, subtitle_file, output_video):
+import numpy as np
+
+from modules.config import config
+from modules.asr import ASREngine, default_engine, get_engine
+from modules import audio, srt
+from modules.artifact_store import artifact_store, link_or_copy
+
+# 是否以 pipe 直接讀取 PCM 轉錄；False 時使用舊的 MP3 檔案流程
+STREAM_AUDIO = config.getboolean("Whisper", "STREAM_AUDIO", fallback=True)
+
+# 分段平行轉錄：每段約 CHUNK_SECONDS 秒，0 表示不分段
+CHUNK_SECONDS = config.getfloat("Whisper", "CHUNK_SECONDS", fallback=60)
+TRANSCRIBE_WORKERS = config.getint("Whisper", "WORKERS", fallback=max(1, (os.cpu_count() or 2) // 2))
+THREADS_PER_WORKER = config.getint("Whisper", "THREADS_PER_WORKER", fallback=2)
+
+# 轉錄前以 VAD 略過沒有聲音的片段；MARGIN_DB 為高於背景噪音多少 dB 才算有聲音
+VAD_ENABLED = config.getboolean("Whisper", "VAD", fallback=True)
+VAD_MARGIN_DB = config.getfloat("Whisper", "VAD_MARGIN_DB", fallback=12.0)
+VAD_PAD_SECONDS = config.getfloat("Whisper", "VAD_PAD_SECONDS", fallback=0.3)
+
+# 分段邊界兩側的字幕若距離邊界在此秒數內且句子未結束，會被接成同一句
+STITCH_GAP_SECONDS = 0.5
+STITCH_MAX_SECONDS = 8.0
+SENTENCE_ENDINGS = ("。", "！", "？", ".", "!", "?", "…")
+
+# 字幕輸出模式：burn 將字幕燒進畫面（需重新編碼），soft 以字幕軌封裝（串流複製，數秒完成）
+SUBTITLE_MODES = ("burn", "soft")
+DEFAULT_SUBTITLE_MODE = config.get("Subtitle", "MODE", fallback="burn")
+# 燒錄時的 x264 preset 與執行緒數（0 表示由 FFmpeg 自動決定）
+BURN_PRESET = config.get("Subtitle", "PRESET", fallback="veryfast")
+BURN_THREADS = config.getint("Subtitle", "THREADS", fallback=0)
+
+# 各容器格式可封裝的字幕編碼
+SOFT_SUBTITLE_CODECS = {
+    ".mp4": "mov_text",
+    ".m4v": "mov_text",
+    ".mov": "mov_text",
+    ".mkv": "srt",
+    ".webm": "webvtt",
+}
+
+def _burn_encoder(output_video: str) -> list:
+    """
+    燒錄時的影像編碼參數：WebM 只能封裝 VP8/VP9/AV1，使用 libvpx-vp9 的即時模式；其他容器使用 libx264 與 BURN_PRESET。
+    """
+    if os.path.splitext(output_video)[1].lower() == ".webm":
+        return ["-c:v", "libvpx-vp9", "-deadline", "realtime", "-cpu-used", "8", "-row-mt", "1"]
+    return ["-c:v", "libx264", "-preset", BURN_PRESET]
+
+def subtitle_mode(mode: str = None) -> str:
+    """
+    檢查字幕輸出模式，未指定或無效時使用預設模式。
+    """
+    return mode if mode in SUBTITLE_MODES else DEFAULT_SUBTITLE_MODE
+
+def effective_mode(output_video: str, mode: str) -> str:
     """
-    使用 FFmpeg 將字幕硬嵌入影片
+    實際使用的字幕輸出模式：容器不支援字幕軌時 soft 改為 burn。
     """
+    if mode == "soft" and os.path.splitext(output_video)[1].lower() not in SOFT_SUBTITLE_CODECS:
+        return "burn"
+    return mode
+
+# 字幕軌語言標記使用 ISO 639-2 代碼
+TRACK_LANGUAGE_CODES = {
+    "zh": "chi", "en": "eng", "ja": "jpn", "ko": "kor", "fr": "fre", "de": "ger",
+    "es": "spa", "it": "ita", "pt": "por", "ru": "rus", "th": "tha", "vi": "vie",
+}
+
+def _track_metadata(track_index, language):
+    """
+    產生字幕軌的語言與標題 metadata 參數。
+    """
+    if not language:
+        return [f"-metadata:s:s:{track_index}", "title=原文"]
+    iso639_2 = TRACK_LANGUAGE_CODES.get(language.split("-")[0].lower(), "und")
+    return [f"-metadata:s:s:{track_index}", f"language={iso639_2}",
+            f"-metadata:s:s:{track_index}", f"title={language}"]
+
+def embed_subtitles(workdir, input_video, subtitle_file, output_video, mode: str = None):
+    """
+    使用 FFmpeg 將字幕嵌入影片，所有字幕軌在同一次 FFmpeg 執行中完成。
+    :param subtitle_file: 字幕路徑，或 (字幕路徑, 語言代碼) 列表；語言為 None 表示原文
+    :param mode: "burn" 將第一條字幕硬嵌入畫面、其餘封裝為字幕軌，"soft" 全部封裝為字幕軌；
+                 容器不支援字幕軌時只燒錄第一條字幕
+    :return: 實際使用的字幕模式
+    """
+    tracks = [(subtitle_file, None)] if isinstance(subtitle_file, str) else list(subtitle_file)
+    mode = subtitle_mode(mode)
+    codec = SOFT_SUBTITLE_CODECS.get(os.path.splitext(output_video)[1].lower())
+    if effective_mode(output_video, mode) != mode:
+        print(f"輸出格式不支援字幕軌，改用燒錄：{output_video}")
+        mode = "burn"
     # # 確保路徑是絕對路徑並且正確使用斜槓
     # input_video = os.path.abspath(input_video).replace("\\", "/")
     # subtitle_file = os.path.abspath(subtitle_file).replace("\\", "/")
@@ -17,29 +108,99 @@ def embed_subtitles(workdir, input_video, subtitle_file, output_video):
     # if not os.path.exists(subtitle_file):
     #     raise FileNotFoundError(f"字幕檔案不存在: {subtitle_file}")
 
+    # burn 模式燒錄第一條字幕，其餘字幕（容器支援時）封裝為字幕軌
+    soft_tracks = tracks if mode == "soft" else (tracks[1:] if codec else [])
+
     try:
-        # FFmpeg 命令 (將字幕路徑用雙引號包起來)
-        ffmpeg_cmd = [
-            "ffmpeg",
-            "-i", input_video,                                 # 輸入影片
-            "-vf", f"subtitles='{subtitle_file}'",             # 加入字幕濾鏡
-            output_video                                       # 輸出檔案
-        ]
-        print("正在燒錄字幕...")
+        ffmpeg_cmd = ["ffmpeg", "-i", input_video]                 # 輸入影片
+        for path, _ in soft_tracks:
+            ffmpeg_cmd += ["-i", path]                             # 輸入字幕
+        ffmpeg_cmd += ["-map", "0:v?", "-map", "0:a?"]
+        for i in range(len(soft_tracks)):
+            ffmpeg_cmd += ["-map", f"{i + 1}:0"]
+
+        if mode == "soft":
+            # 影音串流直接複製，只新增字幕軌
+            ffmpeg_cmd += ["-c:v", "copy"]
+            print(f"正在封裝 {len(soft_tracks)} 條字幕軌...")
+        else:
+            # FFmpeg 命令 (將字幕路徑用雙引號包起來)
+            ffmpeg_cmd += [
+                "-vf", f"subtitles='{tracks[0][0]}'",              # 加入字幕濾鏡
+                *_burn_encoder(output_video),                      # 依容器選擇影像編碼器與速度
+                "-threads", str(BURN_THREADS),                     # 編碼執行緒數
+            ]
+            print("正在燒錄字幕...")
+        ffmpeg_cmd += ["-c:a", "copy"]                             # 音訊不重新編碼
+
+        if soft_tracks:
+            ffmpeg_cmd += ["-c:s", codec]                          # 字幕編碼
+            for i, (_, language) in enumerate(soft_tracks):
+                ffmpeg_cmd += _track_metadata(i, language)
+        ffmpeg_cmd.append(output_video)                            # 輸出檔案
 
         # 執行 FFmpeg 命令
         result = subprocess.run(ffmpeg_cmd, check=True, stderr=subprocess.PIPE, text=True, cwd=workdir)
 
-        print(f"字幕已燒錄完成！輸出檔案：{output_video}")
+        print(f"字幕已嵌入完成！輸出檔案：{output_video}")
     except subprocess.CalledProcessError as e:
         print(f"FFmpeg 執行失敗！錯誤訊息：\n{e.stderr}")
     except Exception as e:
         print(f"發生其他錯誤: {e}")
+    return mode
+
+def video_to_subtitle(video_path: str, subtitle_path: str, job=None, digest: str = None, on_segments=None):
+    """
+    從影片產生 SRT 字幕。
+    :param job: 背景工作 (modules.jobs.Job)，有的話會回報目前階段
+    :param digest: 影片內容的 SHA-256，有的話會重用或保存轉錄結果
+    :param on_segments: 每當有字幕確定時呼叫，參數為新確定的 segments（含 start, end, text）
+    """
+    if digest:
+        cached = artifact_store.get(digest, default_engine.cache_key, None, "subtitles.srt")
+        if cached:
+            print(f"使用快取的字幕：{cached}")
+            link_or_copy(cached, subtitle_path)
+            if on_segments:
+                on_segments([{"start": cue.start_ms / 1000, "end": cue.end_ms / 1000, "text": cue.text}
+                             for cue in srt.read(subtitle_path)])
+            return
 
-def video_to_subtitle(video_path: str, subtitle_path: str):
-    audio_path = subtitle_path + ".mp3"
-    extract_audio(video_path, audio_path)
-    transcribe_audio(audio_path, subtitle_path)
+    if job:
+        job.update("擷取音訊", 5)
+    audio_input = None
+    if STREAM_AUDIO:
+        try:
+            audio_input = audio.load_pcm(video_path)
+            print(f"已解碼音訊：{audio.duration_seconds(audio_input):.1f} 秒")
+        except (RuntimeError, OSError) as e:
+            print(f"PCM 串流失敗，改用音訊檔案：{e}")
+    if audio_input is None:
+        audio_input = subtitle_path + ".mp3"
+        extract_audio(video_path, audio_input)
+    regions = None
+    stage = "語音轉錄"
+    if VAD_ENABLED and isinstance(audio_input, np.ndarray):
+        regions = detect_speech(audio_input)
+        stage = f"語音轉錄（略過 {audio.skipped_fraction(regions, len(audio_input)):.0%} 無聲片段）"
+    if job:
+        job.update(stage, 15)
+        # 依照已轉錄到的時間回報進度（15% ~ 55%）
+        if isinstance(audio_input, np.ndarray) and len(audio_input):
+            duration = audio.duration_seconds(audio_input)
+            forward = on_segments
+
+            def on_segments(segments):
+                if segments:
+                    job.update(stage, 15 + 40 * min(1.0, segments[-1]["end"] / duration))
+                if forward:
+                    forward(segments)
+    # 舊檔可能是快取產物的硬連結，先移除再寫入，避免改寫到快取內容
+    if os.path.exists(subtitle_path):
+        os.unlink(subtitle_path)
+    transcribe_audio(audio_input, subtitle_path, on_segments=on_segments, speech_regions=regions)
+    if digest:
+        artifact_store.put(digest, default_engine.cache_key, None, "subtitles.srt", subtitle_path)
 
 def extract_audio(video_path, audio_path):
     """
@@ -49,33 +210,181 @@ def extract_audio(video_path, audio_path):
     subprocess.run(command, check=True)
     print(f"已提取音訊到: {audio_path}")
 
-def transcribe_audio(audio_path, subtitle_path):
+def detect_speech(samples):
     """
-    使用 Whisper 模型轉錄音訊並儲存為 SRT 格式。
+    以 VAD 找出有聲音的區段，並印出略過的比例。
+    :return: (起始樣本, 結束樣本) 列表
     """
-    print("正在載入 Whisper 模型...")
-    model = whisper.load_model("base")  # 可選 "tiny", "base", "small", "medium", "large"
-    print("模型載入完成，開始轉錄...")
+    regions = audio.speech_regions(samples, margin_db=VAD_MARGIN_DB, pad_seconds=VAD_PAD_SECONDS)
+    skipped = audio.skipped_fraction(regions, len(samples))
+    print(f"VAD：{len(regions)} 個有聲區段，略過 {skipped:.1%} 的音訊")
+    return regions
 
-    result = model.transcribe(audio_path)
-    print("轉錄完成，正在儲存字幕檔案...")
+def transcribe_audio(audio_path, subtitle_path, engine: ASREngine = None, on_segments=None, speech_regions=None):
+    """
+    轉錄音訊並儲存為 SRT 格式。
+    模型由 model_registry 管理，同一個 process 只會載入一次。
+    :param audio_path: 音訊檔案路徑，或 16 kHz 單聲道 float32 PCM 陣列
+    :param engine: 語音辨識引擎 (modules.asr)，預設依 config.ini 中的 [Whisper] ENGINE
+    :param on_segments: 每當有字幕確定時呼叫，參數為新確定的 segments；
+                        長音訊會分段轉錄，讓第一批字幕盡早產生
+    :param speech_regions: 已偵測的有聲區段；未指定且啟用 VAD 時會自動偵測，
+                           只轉錄這些區段，時間戳會換算回原音訊的時間軸
+    """
+    engine = engine or default_engine
+    offsets = None
+    if isinstance(audio_path, np.ndarray) and (speech_regions is not None or VAD_ENABLED):
+        if speech_regions is None:
+            speech_regions = detect_speech(audio_path)
+        audio_path, offsets = audio.compact_regions(audio_path, speech_regions)
+        if on_segments:
+            forward = on_segments
 
-    # 儲存 SRT 格式字幕
-    with open(subtitle_path, "w", encoding="utf-8") as srt_file:
-        for i, segment in enumerate(result["segments"]):
-            start = format_timestamp(segment["start"])
-            end = format_timestamp(segment["end"])
-            text = segment["text"].strip()
-            srt_file.write(f"{i + 1}\n{start} --> {end}\n{text}\n\n")
+            def on_segments(segments):
+                forward(audio.restore_timestamps(segments, offsets))
+    if offsets == []:
+        print("沒有偵測到語音")
+        segments = []
+    elif (isinstance(audio_path, np.ndarray) and CHUNK_SECONDS > 0
+            and (TRANSCRIBE_WORKERS > 1 or on_segments)
+            and audio.duration_seconds(audio_path) > CHUNK_SECONDS * 1.5):
+        segments = transcribe_chunked(audio_path, engine, on_segments)
+    else:
+        print(f"開始轉錄（{engine.name}）...")
+        segments = engine.transcribe(audio_path)
+        if on_segments:
+            on_segments(segments)
+    if offsets:
+        segments = audio.restore_timestamps(segments, offsets)
+    print("轉錄完成，正在儲存字幕檔案...")
 
+    write_srt(segments, subtitle_path)
     print(f"字幕檔案已儲存至: {subtitle_path}")
 
-def format_timestamp(seconds):
+def cue_publisher(job, translate=None):
+    """
+    建立 on_segments callback：將新確定的字幕以 "cue" 事件發布到背景工作，供前端即時顯示。
+    :param job: 背景工作 (modules.jobs.Job)
+    :param translate: 選填，給定文字列表並回傳對應 {語言: 譯文} 列表的函數
+    """
+    count = 0
+
+    def publish(segments):
+        nonlocal count
+        texts = [segment["text"].strip() for segment in segments]
+        translations = translate(texts) if translate and texts else [{} for _ in texts]
+        for segment, text, translated in zip(segments, texts, translations):
+            count += 1
+            job.publish("cue", {
+                "index": count,
+                "start": srt.format_timestamp_ms(srt.seconds_to_ms(segment["start"])),
+                "end": srt.format_timestamp_ms(srt.seconds_to_ms(segment["end"])),
+                "text": text,
+                "translations": translated,
+            })
+
+    return publish
+
+def write_srt(segments, subtitle_path):
+    """
+    將 segments（含 start, end, text）儲存為 SRT 格式。
+    """
+    srt.write(srt.from_segments(segments), subtitle_path)
+
+####################################################################################################
+# 分段平行轉錄
+####################################################################################################
+
+_chunk_pool = None
+_chunk_pool_lock = threading.Lock()
+
+def _init_chunk_worker(threads, engine_name, model_size):
+    """
+    轉錄子程序的初始化：限制執行緒數，並預先載入模型。
+    """
+    engine = get_engine(engine_name, model_size)
+    engine.set_threads(threads)
+    engine.load()
+
+def _transcribe_chunk(samples, offset_seconds, engine_name, model_size):
+    """
+    在子程序中轉錄一段音訊，並將時間戳加上該段在整段音訊中的位移。
+    """
+    segments = get_engine(engine_name, model_size).transcribe(samples)
+    return [
+        {"start": segment["start"] + offset_seconds,
+         "end": segment["end"] + offset_seconds,
+         "text": segment["text"]}
+        for segment in segments
+    ]
+
+def _get_chunk_pool(engine):
+    global _chunk_pool
+    with _chunk_pool_lock:
+        if _chunk_pool is None:
+            # torch 與執行緒不適合 fork，使用 spawn 建立子程序
+            _chunk_pool = ProcessPoolExecutor(
+                max_workers=TRANSCRIBE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_chunk_worker,
+                initargs=(THREADS_PER_WORKER, engine.name, engine.model_size),
+            )
+        return _chunk_pool
+
+def transcribe_chunked(samples, engine, on_segments=None):
+    """
+    在靜音處將音訊切成多段，以多個子程序平行轉錄後依序合併。
+    只有一個子程序時改在目前的 process 中逐段轉錄。
+    :param samples: 16 kHz 單聲道 float32 PCM
+    :param engine: 語音辨識引擎 (modules.asr)
+    :param on_segments: 每當有字幕確定時呼叫，參數為新確定的 segments
+    :return: 時間戳已換算回整段音訊的 segments
+    """
+    chunks = audio.split_at_silences(samples, CHUNK_SECONDS)
+    offsets = [start / audio.SAMPLE_RATE for start, _ in chunks]
+    boundaries = [end / audio.SAMPLE_RATE for _, end in chunks[:-1]]
+    if TRANSCRIBE_WORKERS > 1:
+        print(f"分段轉錄：共 {len(chunks)} 段，{TRANSCRIBE_WORKERS} 個子程序")
+        pool = _get_chunk_pool(engine)
+        futures = [
+            pool.submit(_transcribe_chunk, samples[start:end], offset, engine.name, engine.model_size)
+            for (start, end), offset in zip(chunks, offsets)
+        ]
+        results = (future.result() for future in futures)
+    else:
+        print(f"分段轉錄：共 {len(chunks)} 段")
+        results = (_transcribe_chunk(samples[start:end], offset, engine.name, engine.model_size)
+                   for (start, end), offset in zip(chunks, offsets))
+
+    merged = []
+    emitted = 0
+    for i, segments in enumerate(results):
+        _stitch_segments(merged, segments, boundaries[i - 1] if i > 0 else None)
+        # 最後一句可能會和下一段的第一句接在一起，先保留到下一段完成
+        if on_segments and len(merged) - 1 > emitted:
+            on_segments(merged[emitted:-1])
+            emitted = len(merged) - 1
+    if on_segments and len(merged) > emitted:
+        on_segments(merged[emitted:])
+    return merged
+
+def _stitch_segments(merged, segments, boundary):
     """
-    格式化時間戳為 SRT 標準格式：hh:mm:ss,ms
+    將一段的 segments 接到已合併的 segments 後面；
+    若邊界兩側的字幕緊貼邊界且前一句尚未結束，接成同一句。
+    :param boundary: 兩段之間的邊界時間（秒），第一段為 None
     """
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((seconds % 1) * 1000)
-    return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
+    segments = list(segments)
+    if boundary is not None and merged and segments:
+        last, first = merged[-1], segments[0]
+        if (boundary - last["end"] <= STITCH_GAP_SECONDS
+                and first["start"] - boundary <= STITCH_GAP_SECONDS
+                and not last["text"].strip().endswith(SENTENCE_ENDINGS)
+                and first["end"] - last["start"] <= STITCH_MAX_SECONDS):
+            merged[-1] = {
+                "start": last["start"],
+                "end": first["end"],
+                "text": f'{last["text"].strip()} {first["text"].strip()}',
+            }
+            segments = segments[1:]
+    merged.extend(segments)
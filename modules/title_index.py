@@ -0,0 +1,287 @@
+"""
+本機電影名稱索引。
+
+從快取的 TMDB 詳細資訊（片名、原文片名、alternative_titles、translations 中的繁中、簡中、英文、日文片名）
+建立名稱 → 電影 ID 的索引，以 trigram 找出候選名稱，再以編輯距離評分，支援錯字與部分不同的寫法。
+同一個名稱可以對應多部電影（重拍、同名電影）；名稱中的數字（續集編號）不同時不算相符。
+索引以 array 保存並寫入磁碟，重新啟動時直接載入；只對應一部電影的已知名稱不必再呼叫 TMDB 搜尋。
+"""
+
+import os
+import pickle
+import re
+import threading
+import time
+import unicodedata
+from array import array
+
+from modules.config import config
+from modules.langid import SIMPLIFIED_TO_TRADITIONAL
+from modules.tmdb_cache import response_cache
+
+PUNCTUATION = re.compile(r"[\W_]+")
+# 續集編號：阿拉伯數字、中文數字與羅馬數字（不含容易與單字混淆的 i, v, x）
+NUMBER = re.compile(r"\d+|[一二三四五六七八九十]+|\b(?:ii|iii|iv|vi|vii|viii|ix)\b")
+# 中日韓文字之間的空白不影響名稱
+CJK_SPACE = re.compile(r"\s+(?=[぀-ヿ㐀-鿿가-힯豈-﫿])|(?<=[぀-ヿ㐀-鿿가-힯豈-﫿])\s+")
+
+# 收錄的翻譯片名 (iso_639_1, iso_3166_1)；地區為 None 表示不限
+INDEXED_TRANSLATIONS = (("zh", "TW"), ("zh", "CN"), ("en", None), ("ja", None))
+# 收錄的別名地區
+INDEXED_REGIONS = {"TW", "CN", "HK", "US", "GB", "JP"}
+
+# 以 trigram 分數取前幾個候選，再計算編輯距離
+CANDIDATES = 20
+
+INDEX_VERSION = 1
+
+
+def normalize_title(name: str) -> str:
+    """
+    正規化電影名稱：NFKC（全形轉半形）、casefold、簡體轉繁體、標點與多餘空白改為單一空白，
+    並移除中日韓文字之間的空白。
+    例如 "《复仇者联盟》"、"復仇者聯盟" 與 "復仇者 聯盟" 會得到相同結果。
+    """
+    name = unicodedata.normalize("NFKC", name).casefold()
+    name = name.translate(SIMPLIFIED_TO_TRADITIONAL)
+    name = PUNCTUATION.sub(" ", name).strip()
+    return CJK_SPACE.sub("", name)
+
+
+def trigrams(name: str) -> set:
+    padded = f" {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def number_tokens(name: str) -> list:
+    """
+    正規化名稱中的數字，例如 "蜘蛛人3" → ["3"]。
+    """
+    return NUMBER.findall(name)
+
+
+def edit_distance(a: str, b: str) -> int:
+    """
+    Levenshtein 編輯距離。
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def movie_titles(details: dict) -> set:
+    """
+    取出 TMDB 詳細資訊中要收錄的所有片名。
+    """
+    titles = {details.get("title"), details.get("original_title")}
+    for alternative in details.get("alternative_titles", {}).get("titles", []):
+        if alternative.get("iso_3166_1") in INDEXED_REGIONS:
+            titles.add(alternative.get("title"))
+    for translation in details.get("translations", {}).get("translations", []):
+        for language, region in INDEXED_TRANSLATIONS:
+            if translation.get("iso_639_1") == language and region in (None, translation.get("iso_3166_1")):
+                titles.add(translation.get("data", {}).get("title"))
+    return {title for title in titles if title}
+
+
+class TitleIndex:
+    def __init__(self, path: str = None, save_interval: float = 300):
+        """
+        :param path: 索引檔案路徑，None 表示不寫入磁碟
+        :param save_interval: 新增名稱後至少間隔多久（秒）才寫入磁碟
+        """
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        # 第 i 個名稱的正規化文字、電影 ID 與 trigram 數
+        self._titles: list[str] = []
+        self._movie_ids = array("q")
+        self._gram_counts = array("H")
+        # 名稱 → 索引位置（同名電影有多個），以及 trigram → 含有該 trigram 的名稱位置
+        self._exact: dict[str, list[int]] = {}
+        self._postings: dict[str, array] = {}
+        self._saved_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._titles)
+
+    def add(self, movie_id: int, titles) -> int:
+        """
+        加入一部電影的多個名稱，這部電影已有的名稱會被略過；其他電影的同名名稱會另外保存。
+        :return: 新加入的名稱數
+        """
+        added = 0
+        with self._lock:
+            for title in titles:
+                name = normalize_title(title)
+                positions = self._exact.setdefault(name, []) if name else None
+                if not name or any(self._movie_ids[position] == movie_id for position in positions):
+                    continue
+                position = len(self._titles)
+                grams = trigrams(name)
+                self._titles.append(name)
+                self._movie_ids.append(movie_id)
+                self._gram_counts.append(min(len(grams), 65535))
+                positions.append(position)
+                for gram in grams:
+                    self._postings.setdefault(gram, array("I")).append(position)
+                added += 1
+        return added
+
+    def add_details(self, details: dict) -> int:
+        """
+        加入 TMDB 詳細資訊中的所有片名，並視需要寫入磁碟。
+        """
+        if not details.get("id"):
+            return 0
+        added = self.add(details["id"], movie_titles(details))
+        if added and time.monotonic() - self._saved_at >= self.save_interval:
+            try:
+                self.save()
+            except OSError as e:
+                print(f"寫入電影名稱索引失敗：{e}")
+        return added
+
+    def exact(self, query: str) -> list[int]:
+        """
+        正規化後名稱完全相同的電影 ID，同名電影有多個。
+        """
+        name = normalize_title(query)
+        with self._lock:
+            return [self._movie_ids[position] for position in self._exact.get(name, ())]
+
+    def search(self, query: str, limit: int = 5) -> list[tuple[int, float]]:
+        """
+        模糊搜尋電影名稱。名稱完全相同時回傳所有同名電影；數字（續集編號）不同的名稱不列入結果。
+        :return: [(電影 ID, 分數 0~1)]，依分數由高到低，每部電影只出現一次
+        """
+        name = normalize_title(query)
+        if not name:
+            return []
+        with self._lock:
+            positions = self._exact.get(name)
+            if positions:
+                return [(self._movie_ids[position], 1.0) for position in positions][:limit]
+
+            grams = trigrams(name)
+            shared: dict[int, int] = {}
+            for gram in grams:
+                for position in self._postings.get(gram, ()):
+                    shared[position] = shared.get(position, 0) + 1
+            # Dice 係數
+            scored = sorted(((2 * count / (len(grams) + self._gram_counts[position]), position)
+                             for position, count in shared.items()), reverse=True)[:CANDIDATES]
+            candidates = [(dice, self._titles[position], self._movie_ids[position]) for dice, position in scored]
+
+        numbers = number_tokens(name)
+        best: dict[int, float] = {}
+        for dice, title, movie_id in candidates:
+            # "蜘蛛人3" 與 "蜘蛛人2" 只差一個字，但是不同的電影
+            if number_tokens(title) != numbers:
+                continue
+            similarity = 1 - edit_distance(name, title) / max(len(name), len(title))
+            score = (dice + similarity) / 2
+            if score > best.get(movie_id, 0):
+                best[movie_id] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def match(self, query: str, min_score: float):
+        """
+        取得分數最高且不低於 min_score 的電影 ID，沒有時回傳 None。
+        模糊比對的結果可能不是使用者要的電影，呼叫者應再以 TMDB 搜尋確認。
+        """
+        results = self.search(query, limit=1)
+        if results and results[0][1] >= min_score:
+            return results[0][0]
+        return None
+
+    def save(self):
+        """
+        寫入磁碟（先寫入暫存檔再取代，避免寫到一半的檔案）。
+        """
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                "version": INDEX_VERSION,
+                "titles": self._titles,
+                "movie_ids": self._movie_ids,
+                "gram_counts": self._gram_counts,
+            }
+            self._saved_at = time.monotonic()
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 寫入與取代都在鎖內，同時呼叫的 save 不會寫到同一個暫存檔
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path)
+
+    def load(self) -> bool:
+        """
+        從磁碟載入索引，trigram 反向索引在載入時重建。
+        :return: 是否成功載入
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"讀取電影名稱索引失敗：{e}")
+            return False
+        if data.get("version") != INDEX_VERSION:
+            return False
+        with self._lock:
+            self._titles = data["titles"]
+            self._movie_ids = data["movie_ids"]
+            self._gram_counts = data["gram_counts"]
+            self._exact = {}
+            self._postings = {}
+            for position, name in enumerate(self._titles):
+                self._exact.setdefault(name, []).append(position)
+                for gram in trigrams(name):
+                    self._postings.setdefault(gram, array("I")).append(position)
+        return True
+
+    def build_from_cache(self, cache) -> int:
+        """
+        從 TMDB 回應快取中的所有詳細資訊建立索引。
+        :return: 新加入的名稱數
+        """
+        added = sum(self.add(details["id"], movie_titles(details))
+                    for details in cache.iter_kind("details") if details.get("id"))
+        if added:
+            self.save()
+        return added
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"titles": len(self._titles), "movies": len(set(self._movie_ids)), "trigrams": len(self._postings)}
+
+
+title_index = TitleIndex(
+    path=config.get("TitleIndex", "PATH", fallback="cache/title_index.pickle") or None,
+    save_interval=config.getfloat("TitleIndex", "SAVE_INTERVAL", fallback=300),
+)
+# 模糊比對分數達到此值的電影才列為候選，再以 TMDB 搜尋確認
+MIN_SCORE = config.getfloat("TitleIndex", "MIN_SCORE", fallback=0.85)
+
+
+def load_title_index():
+    """
+    啟動時載入索引；沒有索引檔時從 TMDB 回應快取建立。
+    """
+    start = time.perf_counter()
+    if title_index.load():
+        print(f"已載入電影名稱索引：{len(title_index)} 個名稱，耗時 {time.perf_counter() - start:.2f} 秒")
+    else:
+        added = title_index.build_from_cache(response_cache)
+        print(f"已從快取建立電影名稱索引：{added} 個名稱，耗時 {time.perf_counter() - start:.2f} 秒")
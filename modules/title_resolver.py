@@ -0,0 +1,115 @@
+"""
+電影名稱 → TMDB 電影 ID。
+
+查詢字串先正規化（全形半形、大小寫、標點、空白、簡繁體），寫法不同的同一個名稱共用同一筆紀錄；
+解析結果（包含找不到的名稱）保存在有上限的 LRU 中，之後的查詢不必再呼叫 TMDB 搜尋。
+沒有紀錄的名稱先查本機電影名稱索引 (modules.title_index)：只對應一部電影的已知名稱直接採用，
+同名電影或模糊比對的候選則呼叫 TMDB 搜尋確認。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from modules.config import config
+from modules.tmdb_cache import cached_tmdb_client
+from modules.title_index import normalize_title, title_index, MIN_SCORE
+
+
+class TitleResolver:
+    def __init__(self, client, max_entries: int = 5000, negative_ttl: float = 3600, language: str = "zh-TW",
+                 index=None, min_score: float = 0.85):
+        """
+        :param client: TMDB 客戶端
+        :param index: 本機電影名稱索引 (TitleIndex)，None 表示不使用
+        :param min_score: 索引模糊比對的分數達到此值才列為候選
+        :param max_entries: 最多保存的名稱數量
+        :param negative_ttl: 找不到的名稱保留多久（秒），之後會重新搜尋
+        :param language: 搜尋使用的語言
+        """
+        self.client = client
+        self.index = index
+        self.min_score = min_score
+        self.language = language
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._max_entries = max_entries
+        self._negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, name: str):
+        """
+        只查詢已保存的結果。
+        :return: (是否有紀錄, 電影 ID 或 None)
+        """
+        key = normalize_title(name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                movie_id, stored_at = entry
+                if movie_id is not None or time.time() - stored_at <= self._negative_ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, movie_id
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def remember(self, name: str, movie_id):
+        """
+        保存名稱的解析結果，movie_id 為 None 表示找不到。
+        """
+        key = normalize_title(name)
+        if not key:
+            return
+        with self._lock:
+            self._entries[key] = (movie_id, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def resolve(self, name: str):
+        """
+        取得電影名稱對應的 TMDB 電影 ID（第一個搜尋結果）。
+        :return: 電影 ID，找不到時為 None
+        :raises TMDBError: TMDB 搜尋回應錯誤（不會被保存）
+        """
+        found, movie_id = self.lookup(name)
+        if found:
+            return movie_id
+        candidates = []
+        if self.index is not None:
+            candidates = self.index.exact(name)
+            if len(candidates) == 1:
+                self.remember(name, candidates[0])
+                return candidates[0]
+            if not candidates:
+                movie_id = self.index.match(name, self.min_score)
+                candidates = [movie_id] if movie_id is not None else []
+        # 查詢參數由 requests 進行 URL 編碼
+        results = self.client.get("/search/movie", query=name.strip(), language=self.language)["results"]
+        # 搜尋結果中有索引的候選時採用候選，否則依 TMDB 的相關度採用第一個結果
+        movie_id = next((result["id"] for result in results if result["id"] in candidates),
+                        results[0]["id"] if results else None)
+        self.remember(name, movie_id)
+        return movie_id
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+title_resolver = TitleResolver(
+    cached_tmdb_client,
+    index=title_index,
+    min_score=MIN_SCORE,
+    max_entries=config.getint("TMDBCache", "TITLE_ENTRIES", fallback=5000),
+    negative_ttl=config.getint("TMDBCache", "NEGATIVE_TTL", fallback=3600),
+)
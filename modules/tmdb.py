@@ -1,53 +1,53 @@
-import requests
-import configparser
-import os
-from datetime import datetime
-from azure.ai.translation.text import TextTranslationClient
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.textanalytics import TextAnalyticsClient
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
 from modules import gemini
+from modules import azure, langid
+from modules.tmdb_client import TMDBError
+from modules.tmdb_cache import cached_tmdb_client
+from modules.title_resolver import TitleResolver, title_resolver
+from modules.title_index import title_index
+from modules.sentiment import sentiment_service, text_id
+from modules.movie_record import MovieRecord, fetch_profile
+from modules.movie_render import render_card, render_overview, render_prompt
+from modules.config import config
+
+# 詳細資訊、評論、評論翻譯與情感分析共用的執行緒池
+MAX_CONCURRENCY = config.getint("TMDB", "MAX_CONCURRENCY", fallback=8)
+# 每次查詢的時間上限（秒），超過時回傳已完成的部分（例如沒有情感分析）
+SEARCH_DEADLINE = config.getfloat("TMDB", "SEARCH_DEADLINE", fallback=8.0)
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="tmdb")
+
+def _remaining(deadline):
+    return max(0.0, deadline - time.monotonic())
 
 class MovieSearch:
-    def __init__(self, config_path=None):
+    def __init__(self, client=None, resolver=None):
         """
         初始化 MovieSearch 類別
        
-        :param config_path: config.ini 檔案路徑
+        :param client: TMDB 客戶端，預設使用整個 process 共用、經過回應快取的 cached_tmdb_client
+        :param resolver: 電影名稱 → ID 的 TitleResolver，預設使用共用的 title_resolver
         """
-        # 如果沒有指定路徑，使用預設路徑
-        if config_path is None:
-            config_path = os.path.join(os.path.dirname(__file__), '..', 'config.ini')
-       
-        # 使用 UTF-8 編碼讀取配置文件
-        config = configparser.ConfigParser()
-        config.read(config_path, encoding='utf-8')
-       
-        # 確保成功讀取 API key
-        try:
-            self.tmdb_api_key = config['TMDB']['API_KEY']
-            self.azure_key = config['AzureTranslator']['Key']
-            self.azure_region = config['AzureTranslator']['Region']
-            self.azure_endpoint = config['AzureTranslator']['Endpoint']
-        except KeyError as e:
-            raise ValueError(f"未在 config.ini 中找到 {str(e)} 配置")
-       
-        self.base_url = "https://api.themoviedb.org/3"
+        # 使用共用的 TMDB 客戶端（回應快取、連線池與重試設定）
+        self.client = client or cached_tmdb_client
+        self.resolver = resolver or (title_resolver if client is None else TitleResolver(self.client))
+        self.tmdb_api_key = self.client.api_key
+        self.base_url = self.client.base_url
         
-        # 初始化 Azure 翻譯客戶端
-        try:
-            # 使用新的初始化方式
-            self.translator = TextTranslationClient(
-                credential = AzureKeyCredential(self.azure_key),
-                endpoint = self.azure_endpoint,
-                region = self.azure_region
-            )
-        except Exception as e:
-            print(f"Azure 翻譯客戶端初始化錯誤: {e}")
-            self.translator = None
+        # 使用共用的 Azure 翻譯客戶端
+        self.translator = azure.text_translator
 
     def _detect_language(self, text):
         """
-        偵測輸入文本的語言
+        偵測輸入文本的語言，先以本機 langid 判斷，信心不足時才使用 Azure 偵測
+        :param text: 要偵測語言的文本
+        :return: 語言代碼
+        """
+        return langid.detect_language(text, azure.DETECT_THRESHOLD, fallback=self._azure_detect_language)
+
+    def _azure_detect_language(self, text):
+        """
+        以 Azure 偵測輸入文本的語言
         :param text: 要偵測語言的文本
         :return: 語言代碼
         """
@@ -76,17 +76,14 @@ class MovieSearch:
 
         try:
             # 如果文本已經是中文，直接返回
-            if self._detect_language(text) in ['zh-Hant', 'zh-Hans', 'zh']:
+            if langid.is_chinese(self._detect_language(text)):
                 return text
 
-            # 翻譯
-            response = self.translator.translate(
-                body = [text], 
-                to_language = [target_language]
-            )
+            # 翻譯（經過翻譯記憶快取）
+            translation = azure.translate_texts([text], [target_language])[0]
             # 返回第一個翻譯結果
-            if response and response[0].translations:
-                return response[0].translations[0].text
+            if translation.get(target_language):
+                return translation[target_language]
             else:
                 print("未找到翻譯結果")
                 return text
@@ -94,30 +91,32 @@ class MovieSearch:
             print(f"翻譯失敗: {e}")
             return text
 
-    def _get_movie_reviews(self, movie_id):
+    def _get_movie_reviews(self, movie_id, limit=None, deadline=None):
         """
-        獲取電影評論
+        獲取電影評論，並以執行緒池同時翻譯每則評論
         :param movie_id: TMDB 電影 ID
+        :param limit: 只取前幾則評論，None 表示全部
+        :param deadline: time.monotonic() 的時間上限，逾時未完成的翻譯保留原文
         :return: 電影評論列表
         """
         try:
-            reviews_url = f"{self.base_url}/movie/{movie_id}/reviews?api_key={self.tmdb_api_key}&language=en-US"
-            reviews_response = requests.get(reviews_url)
-            
-            if reviews_response.status_code != 200:
-                print(f"獲取電影評論時發生錯誤：{reviews_response.status_code}")
+            try:
+                reviews_data = self.client.get(f"/movie/{movie_id}/reviews", language="en-US")
+            except TMDBError as e:
+                print(f"獲取電影評論時發生錯誤：{e.status_code}")
                 return []
             
-            reviews_data = reviews_response.json()
-            
+            reviews = reviews_data.get('results', [])[:limit]
             # 翻譯每則評論
+            futures = [_executor.submit(self._translate_text, review['content']) for review in reviews]
+            wait(futures, timeout=_remaining(deadline) if deadline else None)
             translated_reviews = []
-            for review in reviews_data.get('results', []):
-                translated_content = self._translate_text(review['content'])
+            for review, future in zip(reviews, futures):
                 translated_reviews.append({
+                    'id': review['id'],
                     'author': review['author'],
-                    'content': translated_content,
-                    'rating': review.get('author_details', {}).get('rating', '無')
+                    'content': future.result() if future.done() else review['content'],
+                    'rating': review.get('author_details', {}).get('rating') or '無'
                 })
             
             return translated_reviews
@@ -126,156 +125,128 @@ class MovieSearch:
             print(f"獲取電影評論時發生未預期的錯誤：{str(e)}")
             return []
 
-    def search_movie(self, movie_name):
+    def _analyze_reviews(self, reviews, deadline):
         """
-        搜尋電影並獲取詳細資訊
-        :param movie_name: 電影名稱
-        :return: 電影詳細資訊字典
+        以一個批次請求分析已翻譯成中文的評論的情感，結果依文字內容快取
+        :param deadline: time.monotonic() 的時間上限
+        :return: 與 reviews 對應的情感標籤列表，未翻譯、逾時或失敗的為 None
         """
+        # 翻譯逾時或失敗而仍是原文的評論不分析，避免以錯誤的語言分析
+        chinese = [review for review in reviews if langid.is_chinese(langid.detect(review['content'])[0])]
+        if not chinese:
+            return [None] * len(reviews)
+        future = _executor.submit(
+            sentiment_service.analyze, [(review['id'], review['content']) for review in chinese])
         try:
-            # 偵測並翻譯電影名稱（如果不是中文）
-            # detected_lang = self._detect_language(movie_name)
-            # if detected_lang not in ['zh-Hant', 'zh-Hans', 'zh']:
-            #     movie_name = self._translate_text(movie_name, 'en')
-            
-            # 第一步：搜尋電影
-            search_url = f"{self.base_url}/search/movie?api_key={self.tmdb_api_key}&query={movie_name}&language=zh-TW"
-            search_response = requests.get(search_url)
-            if search_response.status_code != 200:
-                return f"搜尋電影時發生錯誤：{search_response.status_code}"
-            search_data = search_response.json()
-           
-            # 如果沒有找到電影
-            if not search_data['results']:
-                return "找不到相關電影"
-            
-            # 取第一個搜尋結果的電影 ID
-            movie_id = search_data['results'][0]['id']
-            
-            # 第二步：獲取電影詳細資訊
-            details_url = f"{self.base_url}/movie/{movie_id}?language=zh-TW&api_key={self.tmdb_api_key}&append_to_response=credits,releases,keywords,alternative_titles,translations,external_ids"
-            details_response = requests.get(details_url)
-            if details_response.status_code != 200:
-                return f"獲取電影詳細資訊時發生錯誤：{details_response.status_code}"
-            movie_details = details_response.json()
-            
-            # 獲取電影評論
-            movie_reviews = self._get_movie_reviews(movie_id)
-            
-            # 翻譯電影名稱
-            # translated_title = self._translate_text(movie_details['title'])
-            translated_title = movie_details['title']
-            
-            # 翻譯劇情簡介
-            # translated_overview = self._translate_text(movie_details['overview'])
-            translated_overview = movie_details['overview']
-            
-            # 提取導演
-            directors = [crew['name'] for crew in movie_details.get('credits', {}).get('crew', [])
-                         if crew['job'] == 'Director']
-            # director = self._translate_text(directors[0]) if directors else "無資訊"
-            director = directors[0] if directors else "無資訊"
-            
-            # 提取主演並翻譯
-            actors = [actor['name'] for actor in movie_details.get('credits', {}).get('cast', [])[:3]]
-            # translated_actors = [self._translate_text(actor) for actor in actors]
-            translated_actors = actors
-            # main_actors = "、".join(translated_actors) if translated_actors else "無資訊"
-            main_actors = "、".join(actors) if actors else "無資訊"
-            
-            # 取得上映年份的中文格式
-            release_date = datetime.strptime(movie_details['release_date'], "%Y-%m-%d")
-            formatted_release_date = release_date.strftime("%Y年%m月%d日")
-            
-            # 產生類型列表
-            genres = [genre['name'] for genre in movie_details.get('genres', [])]
-            # translated_genres = [self._translate_text(genre) for genre in genres]
-            translated_genres = genres
-            genres_str = "、".join(translated_genres) if translated_genres else "無資訊"
-            
-            # 製作國家
-            production_countries = [country['name'] for country in movie_details.get('production_countries', [])]
-            countries_str = "、".join(production_countries) if production_countries else "無資訊"
-            
-            # 製片公司
-            production_companies = [company['name'] for company in movie_details.get('production_companies', [])]
-            companies_str = "、".join(production_companies) if production_companies else "無資訊"
-            
-            # 語言
-            original_language = movie_details.get('original_language', '無資訊')
-            spoken_languages = [lang['name'] for lang in movie_details.get('spoken_languages', [])]
-            languages_str = "、".join(spoken_languages) if spoken_languages else "無資訊"
-            
-            # 電影狀態
-            status_mapping = {
-                'Released': '已上映',
-                'Upcoming': '即將上映',
-                'In Production': '製作中',
-                'Canceled': '已取消'
-            }
-            movie_status = status_mapping.get(movie_details.get('status', ''), '未知')
-            
-            # 預算與票房
-            budget = movie_details.get('budget', 0)
-            revenue = movie_details.get('revenue', 0)
-            
-            # 處理電影評論
-            reviews_section = ""
-            
-            # 查詢英文評論，並翻譯成中文
-        
-            if movie_reviews:
-                # 取前三則或全部評論
-                display_reviews = movie_reviews[:3] if len(movie_reviews) > 3 else movie_reviews
-                reviews_section = "🎬 電影評價:\n"
-                for idx, review in enumerate(display_reviews, 1):
-                    reviews_section += f"評論 {idx}:\n"
-                    reviews_section += f"👤 作者: {review['author']}\n"
-                    if review['rating'] != '無':
-                        reviews_section += f"⭐ 評分: {review['rating']}/10\n"
-                        sentiment = azure_sentiment(review['content'])
-                    reviews_section += f"💬 內容: {review['content']}\n分析結果：{sentiment}\n\n"
-            else:
-                reviews_section = "🎬 電影評價: 這部電影還沒有人評論\n"
-            
-            # 格式化回覆訊息
-            message = f"""🎬 電影基本資訊:
-📝 電影名稱: {translated_title}
-🌍 原始語言: {original_language.upper()}
-⭐ 電影評分: {movie_details['vote_average']}/10
+            results = future.result(timeout=_remaining(deadline))
+        except Exception as e:
+            print(f"情感分析未完成：{e!r}")
+            return [None] * len(reviews)
+        sentiments = {review['id']: result["sentiment"] for review, result in zip(chinese, results) if result}
+        return [sentiments.get(review['id']) for review in reviews]
 
-📊 評價統計:
-🔢 總投票數: {movie_details['vote_count']} 票
+    def load_details(self, movie_id, profile):
+        """
+        獲取電影詳細資訊，只附加查詢設定需要的資料
+        :param movie_id: TMDB 電影 ID
+        :param profile: FetchProfile
+        :return: TMDB 詳細資訊
+        :raises TMDBError: TMDB 回應錯誤
+        """
+        params = {"language": "zh-TW"}
+        if profile.append:
+            params["append_to_response"] = ",".join(profile.append)
+        details = self.client.get(f"/movie/{movie_id}", **params)
+        # 片名（與有附加時的別名、翻譯片名）加入本機電影名稱索引
+        title_index.add_details(details)
+        return details
 
-📅 上映資訊:
-🗓️ 上映日期: {formatted_release_date}
-📊 電影狀態: {movie_status}
+    def load_reviews(self, movie_id, profile, deadline=None):
+        """
+        獲取查詢設定需要的評論數量，翻譯後視需要分析情感
+        :param movie_id: TMDB 電影 ID
+        :param profile: FetchProfile
+        :param deadline: time.monotonic() 的時間上限
+        :return: 評論列表，每則含 sentiment（未分析或逾時為 None）
+        """
+        deadline = deadline or time.monotonic() + SEARCH_DEADLINE
+        reviews = self._get_movie_reviews(movie_id, limit=profile.reviews, deadline=deadline)
+        sentiments = self._analyze_reviews(reviews, deadline) if profile.sentiment else [None] * len(reviews)
+        for review, sentiment in zip(reviews, sentiments):
+            review['sentiment'] = sentiment
+        return reviews
 
-👥 創作團隊:
-🎥 導演: {director}
-🌟 主演: {main_actors}
+    def fetch(self, movie_id, profile="card", deadline=None):
+        """
+        載入電影資料。需要評論時，詳細資訊在背景查詢，同時在目前的執行緒處理評論（含翻譯、情感分析）
+        :param movie_id: TMDB 電影 ID
+        :param profile: FetchProfile 或其名稱："overview", "card", "full"
+        :param deadline: time.monotonic() 的時間上限，預設為現在加上 SEARCH_DEADLINE
+        :return: MovieRecord
+        :raises TMDBError: 獲取詳細資訊時 TMDB 回應錯誤
+        :raises TimeoutError: 超過時間上限仍未取得詳細資訊
+        """
+        profile = fetch_profile(profile)
+        deadline = deadline or time.monotonic() + SEARCH_DEADLINE
+        if not profile.reviews:
+            return MovieRecord(movie_id, profile, self, details=self.load_details(movie_id, profile))
 
-🎭 電影類型: {genres_str}
+        details_future = _executor.submit(self.load_details, movie_id, profile)
+        reviews = self.load_reviews(movie_id, profile, deadline)
+        details = details_future.result(timeout=_remaining(deadline))
+        return MovieRecord(movie_id, profile, self, details=details, reviews=reviews)
 
-📍 製作資訊:
-🌐 製作國家: {countries_str}
-🏢 製片公司: {companies_str}
-🗣️ 電影語言: {languages_str}
+    def find_movie(self, movie_name, profile="card", deadline=None):
+        """
+        搜尋電影並載入第一個搜尋結果的資料
+        :param movie_name: 電影名稱
+        :param profile: FetchProfile 或其名稱
+        :param deadline: time.monotonic() 的時間上限
+        :return: MovieRecord，或錯誤訊息字串
+        """
+        # 偵測並翻譯電影名稱（如果不是中文）
+        # detected_lang = self._detect_language(movie_name)
+        # if detected_lang not in ['zh-Hant', 'zh-Hans', 'zh']:
+        #     movie_name = self._translate_text(movie_name, 'en')
 
-📖 劇情簡介: 
-{translated_overview}
+        # 第一步：將電影名稱解析為 ID（同一個名稱只會搜尋一次）
+        try:
+            movie_id = self.resolver.resolve(movie_name)
+        except TMDBError as e:
+            return f"搜尋電影時發生錯誤：{e.status_code}"
 
-💰 財務資訊:
-💸 電影預算: ${budget:,} USD
-💰 全球票房: ${revenue:,} USD
+        # 如果沒有找到電影
+        if movie_id is None:
+            return "找不到相關電影"
 
-{reviews_section}
-"""
-            return message
-       
+        # 第二步：獲取電影詳細資訊
+        try:
+            return self.fetch(movie_id, profile, deadline)
+        except TMDBError as e:
+            return f"獲取電影詳細資訊時發生錯誤：{e.status_code}"
+        except TimeoutError:
+            return "獲取電影詳細資訊逾時，請稍後再試"
+
+    def search_movie(self, movie_name, deadline=None):
+        """
+        搜尋電影並獲取詳細資訊
+        取得電影 ID 後，詳細資訊與評論（含翻譯、情感分析）同時查詢；
+        超過時間上限時回傳已完成的部分，不讓回覆一直等待
+        :param movie_name: 電影名稱
+        :param deadline: time.monotonic() 的時間上限，預設為現在加上 SEARCH_DEADLINE
+        :return: 電影資訊訊息
+        """
+        try:
+            record = self.find_movie(movie_name, "card", deadline)
+            if isinstance(record, str):
+                return record
+            return render_card(record)
         except Exception as e:
             return f"搜尋電影時發生未預期的錯誤：{str(e)}"
 
+# 整個 process 共用一個 MovieSearch
+movie_searcher = MovieSearch()
+
 def search_movie_command(movie_name):
     '''
     用於 Line Bot 的電影搜尋命令處理函數
@@ -287,74 +258,38 @@ def search_movie_command(movie_name):
     user_input = None
     if '\n' in movie_name:
         movie_name, user_input = movie_name.split('\n', 1)
-    movie_searcher = MovieSearch()
-    movie_info = movie_searcher.search_movie(movie_name)
-    if user_input:
-        return gemini.db_query(movie_info, user_input)
-    else:
-        return movie_info
+    if not user_input:
+        return movie_searcher.search_movie(movie_name)
+    try:
+        # 給 Gemini 的是精簡的電影資訊，不含表情符號與空欄位
+        record = movie_searcher.find_movie(movie_name, "card")
+        movie_info = record if isinstance(record, str) else render_prompt(record)
+    except Exception as e:
+        movie_info = f"搜尋電影時發生未預期的錯誤：{str(e)}"
+    return gemini.db_query(movie_info, user_input)
     
 def get_movie_overview(movie_name):
     """
-    獲取電影的劇情簡介
+    獲取電影的劇情簡介，只查詢詳細資訊，不附加其他資料也不處理評論
     :param movie_name: 電影名稱
     :return: 劇情簡介
     """
     try:
-        movie_searcher = MovieSearch()
-        # 搜尋電影
-        search_url = f"{movie_searcher.base_url}/search/movie?api_key={movie_searcher.tmdb_api_key}&query={movie_name}&language=zh-TW"
-        search_response = requests.get(search_url)
-        if search_response.status_code != 200:
-            return f"搜尋電影時發生錯誤：{search_response.status_code}"
-        search_data = search_response.json()
-        
-        # 如果沒有找到電影
-        if not search_data['results']:
-            return "找不到相關電影"
-        
-        # 取第一個搜尋結果的電影 ID
-        movie_id = search_data['results'][0]['id']
-        
-        # 獲取電影詳細資訊
-        details_url = f"{movie_searcher.base_url}/movie/{movie_id}?language=zh-TW&api_key={movie_searcher.tmdb_api_key}"
-        details_response = requests.get(details_url)
-        if details_response.status_code != 200:
-            return f"獲取電影詳細資訊時發生錯誤：{details_response.status_code}"
-        movie_details = details_response.json()
+        record = movie_searcher.find_movie(movie_name, "overview")
+        if isinstance(record, str):
+            return record
         
         # 返回劇情簡介
-        return movie_details.get('overview', '無劇情簡介')
+        return render_overview(record)
     
     except Exception as e:
         return f"獲取電影劇情簡介時發生未預期的錯誤：{str(e)}"
     
 def azure_sentiment(user_input):
-    #Config Parser
-    config = configparser.ConfigParser()
-    config.read('config.ini')
-    
-    #Config Azure Analytics
-    credential = AzureKeyCredential(config['AzureLanguage']['API_KEY'])
-    
-    text_analytics_client = TextAnalyticsClient(
-        endpoint=config['AzureLanguage']['END_POINT'], 
-        credential=credential)
-    documents = [user_input]
-    response = text_analytics_client.analyze_sentiment(
-        documents, 
-        show_opinion_mining=True,
-        language="zh-hant")
-    print(response)
-    docs = [doc for doc in response if not doc.is_error]
-    result = f"整體：{docs[0].sentiment}\n"
-    for idx, doc in enumerate(docs):
-        for sentence_idx, sentence in enumerate(doc.sentences):
-            opinions = ", ".join([opinion.target.text for opinion in sentence.mined_opinions])
-            result += f"{sentence_idx}：{opinions if opinions else 'N/A'} => {sentence.sentiment}\n"
-        print(f"Document text : {documents[idx]}")
-        print(f"Overall sentiment : {doc.sentiment}")
-    return docs[0].sentiment
-    # sentiment = docs[0].sentiment
-    # scores = docs[0].confidence_scores
-    # return result.strip()
\ No newline at end of file
+    """
+    分析單一文字的整體情感（經過 sentiment_service 的共用客戶端與快取）
+    :param user_input: 要分析的文字
+    :return: 整體情感標籤，例如 positive / neutral / negative / mixed
+    """
+    result = sentiment_service.analyze([(text_id(user_input), user_input)])[0]
+    return result["sentiment"] if result else None
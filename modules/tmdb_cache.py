@@ -0,0 +1,255 @@
+"""
+TMDB 回應快取。
+
+依 API 種類（搜尋、詳細資訊、評論）設定不同的有效時間，前面是記憶體 LRU，後面是選用的 SQLite 磁碟儲存，
+重新啟動後仍可使用；超過可使用時間的紀錄會定期從 SQLite 刪除。
+查詢回傳的是副本，呼叫者修改回應不會影響快取。
+詳細資訊過期後的一段時間內採 stale-while-revalidate：先回傳舊資料，同時在背景向 TMDB 更新，使用者不必等待。
+"""
+
+import copy
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from modules.config import config
+from modules.tmdb_client import tmdb_client
+
+# 依 API 路徑判斷快取種類
+ENDPOINT_KINDS = (
+    (re.compile(r"^/search/"), "search"),
+    (re.compile(r"^/movie/\d+/reviews$"), "reviews"),
+    (re.compile(r"^/movie/\d+$"), "details"),
+)
+
+
+def endpoint_kind(path: str) -> str:
+    for pattern, kind in ENDPOINT_KINDS:
+        if pattern.match(path):
+            return kind
+    return "other"
+
+
+def response_key(path: str, params: dict) -> str:
+    """
+    產生快取鍵：API 路徑加上排序後的查詢參數。
+    """
+    return path + "?" + "&".join(f"{name}={params[name]}" for name in sorted(params))
+
+
+# 兩次刪除過期 SQLite 紀錄之間至少間隔的秒數
+PURGE_INTERVAL = 3600
+
+
+class ResponseCache:
+    def __init__(self, db_path: str = None, memory_entries: int = 2000, ttls: dict = None, stale_ttls: dict = None):
+        """
+        :param db_path: SQLite 檔案路徑，None 表示只使用記憶體
+        :param memory_entries: 記憶體 LRU 最多保存的回應數量
+        :param ttls: 各種類的有效時間（秒），例如 {"search": 3600, "details": 86400}
+        :param stale_ttls: 過期後仍可先回傳舊資料並在背景更新的時間（秒），只有列出的種類會這麼做
+        """
+        self._memory: OrderedDict[str, tuple] = OrderedDict()
+        self._memory_entries = memory_entries
+        self._ttls = ttls or {}
+        self._stale_ttls = stale_ttls or {}
+        self._lock = threading.Lock()
+        self.hits: dict[str, int] = {}
+        self.stale_hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+
+        self._db = None
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " body TEXT NOT NULL)"
+            )
+            self._db.commit()
+        self._purged_at = 0.0
+        self.purge()
+
+    def ttl(self, kind: str) -> float:
+        return self._ttls.get(kind, self._ttls.get("other", 3600))
+
+    def max_age(self, kind: str) -> float:
+        """
+        紀錄可使用的最長時間：有效時間加上過期後仍可先回傳的時間。
+        """
+        return self.ttl(kind) + self._stale_ttls.get(kind, 0)
+
+    def lookup(self, key: str, kind: str):
+        """
+        查詢快取。
+        :return: (回應, 是否已過期但仍可使用)；找不到或已超過可使用時間時回傳 (None, False)
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT stored_at, body FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], json.loads(row[1]))
+                    self._remember(key, entry)
+
+            if entry is not None:
+                age = now - entry[0]
+                if age <= self.ttl(kind):
+                    self.hits[kind] = self.hits.get(kind, 0) + 1
+                    return copy.deepcopy(entry[1]), False
+                if age <= self.max_age(kind):
+                    self.stale_hits[kind] = self.stale_hits.get(kind, 0) + 1
+                    return copy.deepcopy(entry[1]), True
+
+            self.misses[kind] = self.misses.get(kind, 0) + 1
+            return None, False
+
+    def put(self, key: str, kind: str, response):
+        """
+        寫入回應（保存副本，呼叫者之後修改 response 不會影響快取）。
+        """
+        entry = (time.time(), copy.deepcopy(response))
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                 (key, kind, entry[0], json.dumps(response, ensure_ascii=False)))
+                self._db.commit()
+        if entry[0] - self._purged_at >= PURGE_INTERVAL:
+            self.purge()
+
+    def purge(self) -> int:
+        """
+        從 SQLite 刪除超過可使用時間的紀錄，避免資料庫無限增長。
+        :return: 刪除的紀錄數
+        """
+        if self._db is None:
+            return 0
+        now = time.time()
+        deleted = 0
+        with self._lock:
+            self._purged_at = now
+            kinds = [row[0] for row in self._db.execute("SELECT DISTINCT kind FROM responses")]
+            for kind in kinds:
+                deleted += self._db.execute("DELETE FROM responses WHERE kind = ? AND stored_at < ?",
+                                            (kind, now - self.max_age(kind))).rowcount
+            self._db.commit()
+        if deleted:
+            print(f"已刪除 {deleted} 筆過期的 TMDB 快取")
+        return deleted
+
+    def _remember(self, key, entry):
+        # 呼叫者需持有 self._lock
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+    def iter_kind(self, kind: str):
+        """
+        逐筆取出某種類的所有快取回應（不論是否過期），例如用來建立本機電影名稱索引。
+        """
+        if self._db is not None:
+            with self._lock:
+                rows = self._db.execute("SELECT body FROM responses WHERE kind = ?", (kind,)).fetchall()
+            for row in rows:
+                yield json.loads(row[0])
+        else:
+            with self._lock:
+                entries = [entry for key, entry in self._memory.items() if endpoint_kind(key.split("?")[0]) == kind]
+            for _, response in entries:
+                yield copy.deepcopy(response)
+
+    def stats(self) -> dict:
+        """
+        回傳各種類的命中、過期命中與未命中次數以及命中率。
+        """
+        with self._lock:
+            kinds = set(self.hits) | set(self.stale_hits) | set(self.misses)
+            result = {"memory_entries": len(self._memory), "kinds": {}}
+            for kind in sorted(kinds):
+                hits, stale, misses = self.hits.get(kind, 0), self.stale_hits.get(kind, 0), self.misses.get(kind, 0)
+                lookups = hits + stale + misses
+                result["kinds"][kind] = {
+                    "hits": hits,
+                    "stale_hits": stale,
+                    "misses": misses,
+                    "hit_ratio": (hits + stale) / lookups if lookups else 0.0,
+                }
+            return result
+
+
+class CachedTMDBClient:
+    """
+    介面與 TMDBClient 相同，查詢先經過 ResponseCache；只有成功的回應會被快取。
+    """
+
+    def __init__(self, client, cache: ResponseCache):
+        self.client = client
+        self.cache = cache
+        self.api_key = client.api_key
+        self.base_url = client.base_url
+        self._refreshing: set[str] = set()
+        self._refreshing_lock = threading.Lock()
+
+    def get(self, path: str, **params) -> dict:
+        """
+        :raises TMDBError / requests.RequestException: 同 TMDBClient.get
+        """
+        kind = endpoint_kind(path)
+        key = response_key(path, params)
+        response, stale = self.cache.lookup(key, kind)
+        if response is not None:
+            if stale:
+                self._refresh_in_background(key, kind, path, params)
+            return response
+        response = self.client.get(path, **params)
+        self.cache.put(key, kind, response)
+        return response
+
+    def _refresh_in_background(self, key, kind, path, params):
+        # 同一個鍵同時只會有一個背景更新
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.cache.put(key, kind, self.client.get(path, **params))
+            except Exception as e:
+                print(f"背景更新 TMDB 快取失敗：{path} {e}")
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="tmdb-refresh", daemon=True).start()
+
+
+response_cache = ResponseCache(
+    db_path=config.get("TMDBCache", "PATH", fallback="cache/tmdb.sqlite3") or None,
+    memory_entries=config.getint("TMDBCache", "MEMORY_ENTRIES", fallback=2000),
+    ttls={
+        "search": config.getint("TMDBCache", "SEARCH_TTL", fallback=6 * 3600),
+        "details": config.getint("TMDBCache", "DETAILS_TTL", fallback=24 * 3600),
+        "reviews": config.getint("TMDBCache", "REVIEWS_TTL", fallback=12 * 3600),
+        "other": config.getint("TMDBCache", "OTHER_TTL", fallback=3600),
+    },
+    stale_ttls={
+        "details": config.getint("TMDBCache", "DETAILS_STALE_TTL", fallback=7 * 24 * 3600),
+    },
+)
+
+cached_tmdb_client = CachedTMDBClient(tmdb_client, response_cache)
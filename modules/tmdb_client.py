@@ -0,0 +1,75 @@
+"""
+TMDB API 客戶端。
+
+整個 process 共用一個 requests.Session：連線保持 keep-alive 並放在有上限的連線池中，
+不必每次查詢都重新建立 TCP + TLS 連線。每個請求都有逾時，遇到 429 / 5xx 時依 backoff 重試。
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from modules.config import config
+
+
+class TMDBError(Exception):
+    """
+    TMDB 回應非 200 時丟出，status_code 為 HTTP 狀態碼。
+    """
+
+    def __init__(self, status_code: int, path: str):
+        super().__init__(f"TMDB {path} 回應 {status_code}")
+        self.status_code = status_code
+        self.path = path
+
+
+class TMDBClient:
+    base_url = "https://api.themoviedb.org/3"
+
+    def __init__(self, api_key: str, timeout: float = 5.0, connect_timeout: float = 3.05,
+                 max_retries: int = 3, backoff_factor: float = 0.5, pool_size: int = 10):
+        """
+        :param api_key: TMDB API key
+        :param timeout: 讀取逾時（秒）
+        :param connect_timeout: 連線逾時（秒）
+        :param max_retries: 429 / 5xx 與連線錯誤的最多重試次數
+        :param backoff_factor: 重試間隔為 backoff_factor * 2^(重試次數-1) 秒；429 時以 Retry-After 為準
+        :param pool_size: 連線池最多保留的連線數
+        """
+        self.api_key = api_key
+        self.timeout = (connect_timeout, timeout)
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.params = {"api_key": api_key}
+
+    def get(self, path: str, **params) -> dict:
+        """
+        以 GET 呼叫 TMDB API，參數由 requests 進行 URL 編碼。
+        :param path: API 路徑，例如 "/search/movie"
+        :param params: 查詢參數
+        :return: 解析後的 JSON
+        :raises TMDBError: 回應不是 200
+        :raises requests.RequestException: 連線失敗或逾時（已重試後）
+        """
+        response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+        if response.status_code != 200:
+            raise TMDBError(response.status_code, path)
+        return response.json()
+
+
+tmdb_client = TMDBClient(
+    api_key=config["TMDB"]["API_KEY"],
+    timeout=config.getfloat("TMDB", "TIMEOUT", fallback=5.0),
+    max_retries=config.getint("TMDB", "MAX_RETRIES", fallback=3),
+    backoff_factor=config.getfloat("TMDB", "BACKOFF_FACTOR", fallback=0.5),
+    pool_size=config.getint("TMDB", "POOL_SIZE", fallback=10),
+)
@@ -1,25 +1,23 @@
 import configparser
 import os
-import re
-from azure.ai.translation.text import TextTranslationClient
-from azure.core.credentials import AzureKeyCredential
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from azure.core.exceptions import HttpResponseError
-from flask import Flask, request, send_file,render_template, send_file
+from werkzeug.exceptions import HTTPException
+from flask import Flask, request, render_template, jsonify
 import os
 
-from modules import subtitle
+from modules import subtitle, srt, uploads
+from modules.azure import translate_texts
+from modules.jobs import job_queue
+from modules.asr import default_engine
+from modules.artifact_store import artifact_store, link_or_copy
+from modules.artifact_store import output_name as artifact_output_name
 
 # Config Parser
 config = configparser.ConfigParser()
 config.read("config.ini")
 
-# Translator Setup
-text_translator = TextTranslationClient(
-    credential=AzureKeyCredential(config["AzureTranslator"]["Key"]),
-    endpoint=config["AzureTranslator"]["EndPoint"],
-    region=config["AzureTranslator"]["Region"],
-)
-
 app = Flask(__name__)
 
 # 用來保存每個使用者的語言選擇
@@ -29,26 +27,101 @@ user_languages = {}
 translated_srt_filename = "translated_subtitles.srt"
 
 
-def azure_translate(user_input, target_languages):
+# Azure Translator 單次請求的限制：最多 1000 個元素、總字元數 50000（字元數會乘上目標語言數）
+MAX_ELEMENTS_PER_REQUEST = 1000
+MAX_CHARS_PER_REQUEST = 50000
+
+# 同時送出的翻譯請求數量
+TRANSLATE_WORKERS = config.getint("AzureTranslator", "MAX_CONCURRENCY", fallback=4)
+
+
+def _pack_batches(texts, target_count):
+    """
+    將字幕文字依照 Azure 的元素數與字元數限制打包成多個批次。
+    :param texts: 要翻譯的文字列表
+    :param target_count: 目標語言數量
+    :return: 每個批次包含的文字索引列表
+    """
+    batches = []
+    batch = []
+    batch_chars = 0
+    for index, text in enumerate(texts):
+        chars = len(text) * target_count
+        if batch and (len(batch) >= MAX_ELEMENTS_PER_REQUEST or batch_chars + chars > MAX_CHARS_PER_REQUEST):
+            batches.append(batch)
+            batch = []
+            batch_chars = 0
+        batch.append(index)
+        batch_chars += chars
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _translate_batch(texts, target_languages):
+    """
+    以單一請求將一個批次的文字翻譯成所有目標語言。
+    翻譯失敗或缺少某個語言時保留原文。
+    :return: (與 texts 索引一一對應的 {目標語言: 譯文}, 保留原文的 (批次內索引, 目標語言) 列表)
+    """
     try:
-        # 使用者輸入文本進行翻譯
-        input_text_elements = [user_input]
-
-        # 進行多語言翻譯
-        response = text_translator.translate(
-            body=input_text_elements, to_language=target_languages
-        )
-
-        translations = response if response else []
-        if translations:
-            result = "\n".join([f" {trans.text}" for trans in translations[0].translations])
-            return result
-        else:
-            return "翻譯失敗。"
+        translations = translate_texts(texts, target_languages)
     except HttpResponseError as exception:
         print(f"Error Code: {exception.error}")
         print(f"Message: {exception.error.message}")
-        return "翻譯過程中發生錯誤。"
+        translations = [{} for _ in texts]
+    failed = [(index, language) for index, item in enumerate(translations)
+              for language in target_languages if language not in item]
+    return [
+        {language: item.get(language, text) for language in target_languages}
+        for text, item in zip(texts, translations)
+    ], failed
+
+
+def azure_translate_batch(texts, target_languages, failed: set = None):
+    """
+    批次翻譯多段文字：依照服務限制打包成多個請求，並以有上限的執行緒池同時送出。
+    每個請求同時翻譯成所有目標語言。
+    :param texts: 要翻譯的文字列表
+    :param target_languages: 目標語言列表
+    :param failed: 有的話會加入翻譯失敗而保留原文的 (索引, 目標語言)
+    :return: 與 texts 索引一一對應的 {目標語言: 譯文}
+    """
+    results = [{language: text for language in target_languages} for text in texts]
+    batches = _pack_batches(texts, len(target_languages))
+    if not batches:
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(TRANSLATE_WORKERS, len(batches))) as pool:
+        futures = {
+            pool.submit(_translate_batch, [texts[i] for i in batch], target_languages): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            translated_batch, failed_batch = future.result()
+            for index, translated in zip(batch, translated_batch):
+                results[index] = translated
+            if failed is not None:
+                failed.update((batch[index], language) for index, language in failed_batch)
+    print(f"已翻譯 {len(texts)} 段字幕，共 {len(batches)} 個請求")
+    return results
+
+
+def translate_cues(cues, target_languages):
+    """
+    翻譯字幕：只送出每段字幕的文字，序號與時間軸維持原樣。
+    :param cues: srt.Cue 列表
+    :param target_languages: 目標語言列表
+    :return: ({目標語言: 翻譯後的 Cue 列表}, 有字幕翻譯失敗而保留原文的目標語言集合)
+    """
+    failed = set()
+    translations = azure_translate_batch([cue.text for cue in cues], target_languages, failed)
+    return {
+        language: [cue.with_text(item[language]) for cue, item in zip(cues, translations)]
+        for language in target_languages
+    }, {language for _, language in failed}
+
 
 @app.route("/", methods=["GET"])
 def index():
@@ -61,117 +134,101 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 # 確保 uploads 資料夾存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# 清理與格式化 SRT 文件
-# 清理與格式化 SRT 文件
-def clean_and_format_srt(srt_lines):
-    cleaned_lines = []
-    previous_time_marker = None  # 記錄上一次的時間標記
-
-    for line in srt_lines:
-        # 移除每行開頭和結尾的空格
-        line = line.strip()
-
-        # 將 ' - >' 替換為 '-->'
-        line = line.replace(" - >", " -->")
-        
-        # 將全形冒號替換為半形冒號
-        line = line.replace("：", ":")
-        line = line.replace(" ： ", " : ")
-
-        # 檢查是否是時間軸
-        time_marker_match = re.match(r"^\d{2}:\d{2}:\d{2},\d{3} --> \d{2}:\d{2}:\d{2},\d{3}$", line)
-
-        # 如果是時間軸，檢查是否與上一個時間軸相同
-        if time_marker_match:
-            if line == previous_time_marker:
-                continue  # 如果時間軸相同，跳過這一行
-            previous_time_marker = line  # 更新上一行的時間軸
-
-        # 將時間軸拆開並比較
-        time_lines = line.split("\n")
-        if len(time_lines) == 1:
-            line = line
-        elif len(time_lines) >= 2:
-            line1 = time_lines[0].strip()
-            line2 = time_lines[1].strip()
-
-            if line1 == line2:  # 如果兩個時間軸相同，則跳過第二個
-                line = line1
-            else:
-                line = f"{line1}\n{line2}"
-                
-            if line1 == line2:  # 如果兩個時間軸相同，則跳過第二個
-                line=line1 
-
-        #line = line.strip()  # 去除每行前後的空白字符
-        # 移除多餘的空行並加入內容
-        if line:
-            cleaned_lines.append(line)
-        else:
-            # 避免多個空行，只保留一個空行
-            if cleaned_lines and cleaned_lines[-1] != "":
-                cleaned_lines.append("")
-
-    # 最後將字幕段落組合回正確格式
-    final_output = []
-    block = []
-    for line in cleaned_lines:
-        if line == "":
-            if block:  # 處理每段字幕
-                final_output.append("\n".join(block))
-                block = []
-        else:
-            block.append(line)
-
-    if block:  # 處理最後一段字幕
-        final_output.append("\n".join(block))
-
-    return "\n\n".join(final_output)
-
-
 # 處理 SRT 檔案翻譯與格式化
 @app.route("/translate_srt", methods=["POST"])
 def translate_srt():
-    file = request.files.get("file")
-    target_languages = request.form.get("languages").split(" ")  # 接收語言列表
-
-    if file and target_languages:
-        # 儲存原始檔案
-        video_file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
-        file.save(video_file_path)
-        subtitle.video_to_subtitle(video_file_path, f'outputs/{file.filename}.srt')
-
-        # 讀取 SRT 檔案內容
-        srt_file_path = os.path.join('outputs', f'{file.filename}.srt')
-        # file.save(srt_file_path)
-
-        # 讀取 SRT 檔案內容
-        with open(srt_file_path, "r", encoding="utf-8") as f:
-            srt_lines = f.readlines()
-
-        # 逐行翻譯字幕內容
-        translated_lines = []
-        for line in srt_lines:
-            if line.strip() and not re.match(r"^\d+$", line.strip()):  # 忽略純數字行
-                translated_text = azure_translate(line.strip(), target_languages)
-                translated_lines.append(translated_text)
+    try:
+        # 先檢查語言，沒有語言時不保存上傳的檔案（暫存檔在請求結束時刪除）
+        uploads.prepare_upload("video")
+        target_languages = request.form.get("languages", "").split()  # 接收語言列表
+        if not target_languages:
+            return jsonify({"reply": "請提供 SRT 檔案及語言選擇。"}), 400
+        # 檔案串流寫入並計算 SHA-256，以內容雜湊命名，同名但內容不同的檔案不會互相覆蓋
+        video_file_path, digest, filename = uploads.receive_upload("video")
+    except HTTPException as e:
+        return jsonify({"reply": e.description}), e.code
+
+    if video_file_path:
+        mode = subtitle.effective_mode(filename, subtitle.subtitle_mode(request.form.get("subtitle_mode")))
+        output_name = artifact_output_name(digest, default_engine.cache_key, target_languages, mode, filename)
+        result_url = request.url_root + f"uploads/{output_name}"
+
+        # 相同內容、語言與字幕模式已處理過，直接回傳快取結果
+        cached = artifact_store.get(digest, default_engine.cache_key, target_languages,
+                                    f"video_{mode}" + os.path.splitext(filename)[1])
+        if cached:
+            link_or_copy(cached, os.path.join(app.config["UPLOAD_FOLDER"], output_name))
+            return jsonify({"reply": result_url, "result_url": result_url})
+
+        # 轉錄、翻譯與燒錄放到背景佇列執行，立即回傳 job ID
+        try:
+            job = job_queue.submit(_translate_srt_job, digest, video_file_path, output_name, target_languages,
+                                   mode, result_url=result_url)
+        except queue.Full:
+            return jsonify({"reply": "目前字幕工作過多，請稍後再試"}), 503
+        return jsonify({
+            "reply": f"檔案 {filename} 上傳成功，字幕處理中",
+            "job_id": job.id,
+            "status_url": request.url_root + f'jobs/{job.id}',
+            "events_url": request.url_root + f'jobs/{job.id}/events',
+        }), 202
+
+    return jsonify({"reply": "請提供 SRT 檔案及語言選擇。"}), 400
+
+
+def _translate_srt_job(job, digest, video_file_path, output_name, target_languages, mode):
+    """
+    背景執行的字幕翻譯工作：轉錄一次、所有語言一起翻譯，再以一次 FFmpeg 嵌入所有字幕軌。
+    """
+    os.makedirs('outputs', exist_ok=True)
+    base_name = os.path.basename(video_file_path)
+    srt_file_path = os.path.join('outputs', f'{base_name}.srt')
+    # 每段字幕一確定就翻譯並推送給前端；結果會進入翻譯快取，之後的整批翻譯不會重複計費
+    subtitle.video_to_subtitle(video_file_path, srt_file_path, job=job, digest=digest,
+                               on_segments=subtitle.cue_publisher(
+                                   job, lambda texts: azure_translate_batch(texts, target_languages)))
+
+    # 每個語言一個 SRT，已翻譯過的語言直接使用快取
+    missing_languages = []
+    for language in target_languages:
+        cached_srt = artifact_store.get(digest, default_engine.cache_key, [language], "subtitles.srt")
+        if cached_srt:
+            link_or_copy(cached_srt, os.path.join('outputs', f'{base_name}.{language}.srt'))
+        else:
+            missing_languages.append(language)
+
+    failed_languages = set()
+    if missing_languages:
+        # 讀取字幕並只翻譯字幕文字
+        job.update("翻譯字幕", 55)
+        translated, failed_languages = translate_cues(list(srt.read(srt_file_path)), missing_languages)
+        for language, cues in translated.items():
+            # 先移除可能是快取硬連結的舊檔，避免改寫到快取內容
+            language_srt_path = os.path.join('outputs', f'{base_name}.{language}.srt')
+            if os.path.exists(language_srt_path):
+                os.unlink(language_srt_path)
+            srt.write(cues, language_srt_path)
+            # 有字幕保留原文時不寫入快取，下次再重新翻譯
+            if language in failed_languages:
+                print(f"部分字幕翻譯失敗，不快取 {language} 字幕")
             else:
-                translated_lines.append(line.strip())
-
-        # 格式化翻譯後的字幕內容
-        formatted_srt_content = clean_and_format_srt(translated_lines)
-        
-        # 保存翻譯與格式化後的 SRT 檔案
-        # translated_srt_filename = f"translated_{file.filename}"
-        # translated_srt_path = os.path.join(app.config["UPLOAD_FOLDER"], translated_srt_filename)
-        with open(srt_file_path, "w", encoding="utf-8") as f:
-            f.write(formatted_srt_content)
-
-        subtitle.embed_subtitles('uploads', file.filename, f'../outputs/{file.filename}.srt', f'subtitled_{file.filename}')
-
-        return send_file(f'uploads/subtitled_{file.filename}', as_attachment=True)
-
-    return "請提供 SRT 檔案及語言選擇。"
+                artifact_store.put(digest, default_engine.cache_key, [language], "subtitles.srt", language_srt_path)
+
+    # 所有翻譯字幕與原文字幕在同一次 FFmpeg 執行中嵌入
+    tracks = [(f'../outputs/{base_name}.{language}.srt', language) for language in target_languages]
+    tracks.append((f'../outputs/{base_name}.srt', None))
+
+    job.update("燒錄字幕" if mode == "burn" else "封裝字幕軌", 70)
+    output_video_path = os.path.join('uploads', output_name)
+    if os.path.exists(output_video_path):
+        os.unlink(output_video_path)
+    mode = subtitle.embed_subtitles('uploads', base_name, tracks, output_name, mode=mode)
+    if not os.path.exists(output_video_path):
+        raise RuntimeError("字幕嵌入失敗")
+    # 所有字幕都翻譯成功時才快取影片，否則下次重新翻譯並嵌入
+    if not failed_languages:
+        artifact_store.put(digest, default_engine.cache_key, target_languages,
+                           f"video_{mode}" + os.path.splitext(base_name)[1], output_video_path)
 
 
 if __name__ == "__main__":
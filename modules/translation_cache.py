@@ -0,0 +1,119 @@
+"""
+翻譯記憶快取。
+
+以 (原文 SHA-256, 來源語言, 目標語言) 為鍵，前面是記憶體 LRU，後面是 SQLite 磁碟儲存，
+讓重複出現的字幕與評論不必再次送到 Azure 翻譯。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from modules.config import config
+
+
+def text_key(text: str, source_language: str, target_language: str) -> tuple:
+    """
+    產生快取鍵：(原文雜湊, 來源語言, 目標語言)。未指定來源語言時使用 "auto"。
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return digest, source_language or "auto", target_language
+
+
+class TranslationCache:
+    def __init__(self, db_path: str = None, memory_entries: int = 10000):
+        """
+        :param db_path: SQLite 檔案路徑，None 表示只使用記憶體
+        :param memory_entries: 記憶體 LRU 最多保存的翻譯數量
+        """
+        self._memory: OrderedDict[tuple, str] = OrderedDict()
+        self._memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " text_hash TEXT NOT NULL,"
+                " source_language TEXT NOT NULL,"
+                " target_language TEXT NOT NULL,"
+                " translation TEXT NOT NULL,"
+                " PRIMARY KEY (text_hash, source_language, target_language))"
+            )
+            self._db.commit()
+
+    def get(self, text: str, source_language: str, target_language: str):
+        """
+        查詢翻譯，找不到時回傳 None。
+        """
+        key = text_key(text, source_language, target_language)
+        with self._lock:
+            translation = self._memory.get(key)
+            if translation is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return translation
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT translation FROM translations"
+                    " WHERE text_hash = ? AND source_language = ? AND target_language = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put_many(self, items):
+        """
+        寫入多筆翻譯。
+        :param items: (原文, 來源語言, 目標語言, 譯文) 的列表
+        """
+        rows = [text_key(text, source, target) + (translation,)
+                for text, source, target, translation in items]
+        with self._lock:
+            for row in rows:
+                self._remember(row[:3], row[3])
+            if self._db is not None and rows:
+                self._db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+
+    def _remember(self, key, translation):
+        # 呼叫者需持有 self._lock
+        self._memory[key] = translation
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        回傳命中與未命中次數。
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+translation_cache = TranslationCache(
+    db_path=config.get("TranslationCache", "PATH", fallback="cache/translations.sqlite3") or None,
+    memory_entries=config.getint("TranslationCache", "MEMORY_ENTRIES", fallback=10000),
+)
@@ -0,0 +1,358 @@
+"""
+上傳檔案接收。
+
+- multipart 上傳：以自訂的 Request 讓 Werkzeug 把檔案內容直接寫進暫存檔並同時計算 SHA-256，
+  完成後只需 rename 到最終位置，不再經過 FileStorage.save() 複製一次。
+- 大小與類型限制：依上傳種類（圖片 / 影片）在讀取內容前就檢查。
+- 分段續傳：大檔案可以分段 PUT，失敗時查詢已收到的位移後從中斷處繼續。
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+
+from flask import Request, request
+from werkzeug.exceptions import (RequestEntityTooLarge, UnsupportedMediaType, BadRequest, NotFound, Conflict,
+                                 TooManyRequests)
+from werkzeug.utils import secure_filename
+
+from modules.config import config
+
+UPLOAD_FOLDER = "uploads"
+# 暫存資料夾需與 UPLOAD_FOLDER 在同一個檔案系統，完成時才能直接 rename
+TEMP_FOLDER = config.get("Uploads", "TEMP_FOLDER", fallback="uploads_partial")
+
+MB = 1024 * 1024
+
+# 各種類上傳的大小上限與允許的副檔名
+UPLOAD_KINDS = {
+    "image": {
+        "max_bytes": config.getint("Uploads", "IMAGE_MAX_MB", fallback=20) * MB,
+        "extensions": {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"},
+    },
+    "video": {
+        "max_bytes": config.getint("Uploads", "VIDEO_MAX_MB", fallback=2048) * MB,
+        "extensions": {".mp4", ".m4v", ".mov", ".mkv", ".webm", ".avi", ".mp3", ".wav", ".m4a"},
+    },
+}
+
+# 分段續傳每段的大小
+CHUNK_SIZE = config.getint("Uploads", "CHUNK_MB", fallback=8) * MB
+# 未完成的分段上傳保留多久（秒）
+SESSION_TTL = config.getint("Uploads", "SESSION_TTL", fallback=24 * 3600)
+# 同時存在的分段上傳數量上限（全部與每個用戶端），超過時回傳 429
+MAX_SESSIONS = config.getint("Uploads", "MAX_SESSIONS", fallback=200)
+MAX_SESSIONS_PER_CLIENT = config.getint("Uploads", "MAX_SESSIONS_PER_CLIENT", fallback=4)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(TEMP_FOLDER, exist_ok=True)
+
+
+def check_file_type(kind: str, filename: str):
+    """
+    檢查副檔名是否為該上傳種類允許的類型。
+    :raises UnsupportedMediaType: 不允許的類型
+    """
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension not in UPLOAD_KINDS[kind]["extensions"]:
+        raise UnsupportedMediaType(f"不支援的檔案類型：{extension or filename}")
+
+
+def check_file_size(kind: str, size):
+    """
+    :raises RequestEntityTooLarge: 超過該上傳種類的大小上限
+    """
+    if size is not None and size > UPLOAD_KINDS[kind]["max_bytes"]:
+        raise RequestEntityTooLarge(f"檔案超過 {UPLOAD_KINDS[kind]['max_bytes'] // MB} MB 上限")
+
+
+def _final_path(digest: str, filename: str) -> str:
+    return os.path.join(UPLOAD_FOLDER, f"{digest[:16]}_{secure_filename(filename)}")
+
+
+class HashingFile(io.FileIO):
+    """
+    寫入時同時計算 SHA-256 的暫存檔；未完成就關閉時會自動刪除。
+    """
+
+    def __init__(self, max_bytes: int = None):
+        fd_path = os.path.join(TEMP_FOLDER, f".upload_{uuid.uuid4().hex}")
+        super().__init__(fd_path, "w+b")
+        self.path = fd_path
+        self.sha256 = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.committed = False
+
+    def write(self, data) -> int:
+        self.written += len(data)
+        if self.max_bytes is not None and self.written > self.max_bytes:
+            raise RequestEntityTooLarge(f"檔案超過 {self.max_bytes // MB} MB 上限")
+        self.sha256.update(data)
+        return super().write(data)
+
+    def commit(self, filename: str) -> tuple[str, str]:
+        """
+        將暫存檔移到最終位置（以 SHA-256 前綴命名）。
+        :return: (檔案路徑, SHA-256)
+        """
+        digest = self.sha256.hexdigest()
+        file_path = _final_path(digest, filename)
+        super().close()
+        os.replace(self.path, file_path)
+        self.committed = True
+        return file_path, digest
+
+    def close(self):
+        super().close()
+        if not self.committed and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class UploadRequest(Request):
+    """
+    讓 multipart 檔案直接寫入 HashingFile。
+    視圖可以在讀取 request.files 前設定 request.upload_kind，以在寫入前檢查類型與大小。
+    """
+    upload_kind = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_bytes = None
+        if self.upload_kind:
+            check_file_type(self.upload_kind, filename)
+            max_bytes = UPLOAD_KINDS[self.upload_kind]["max_bytes"]
+        return HashingFile(max_bytes)
+
+
+def prepare_upload(kind: str):
+    """
+    在讀取 request.form 或 request.files 之前呼叫：以 Content-Length 檢查大小，
+    並讓解析時寫入的檔案依上傳種類檢查類型與大小。檔案在 receive_upload 之前不會移到最終位置，
+    請求結束時未使用的暫存檔會被刪除，可以先檢查其他表單欄位。
+    :raises RequestEntityTooLarge: 超過該上傳種類的大小上限
+    """
+    check_file_size(kind, request.content_length)
+    request.upload_kind = kind
+
+
+def receive_upload(kind: str) -> tuple[str, str, str]:
+    """
+    接收目前請求中的上傳檔案：表單欄位 upload_id（已完成的分段上傳）或 multipart 欄位 file。
+    :param kind: 上傳種類，"image" 或 "video"
+    :return: (檔案路徑, SHA-256, 原始檔名)
+    :raises BadRequest / RequestEntityTooLarge / UnsupportedMediaType: 上傳不合法
+    """
+    prepare_upload(kind)
+
+    upload_id = request.form.get("upload_id")
+    if upload_id:
+        # 已完成的分段上傳只能使用一次，使用後即從 upload_sessions 移除
+        session = upload_sessions.take(upload_id, kind)
+        if session is None:
+            raise BadRequest("找不到已完成的上傳")
+        return session.result + (session.filename,)
+
+    file = request.files.get("file")
+    if file is None or file.filename == "":
+        raise BadRequest("沒有選擇檔案")
+    check_file_type(kind, file.filename)
+    if isinstance(file.stream, HashingFile):
+        file_path, digest = file.stream.commit(file.filename)
+    else:
+        # 非 UploadRequest 的請求：寫入暫存檔後再移到最終位置
+        temp = HashingFile(UPLOAD_KINDS[kind]["max_bytes"])
+        for chunk in iter(lambda: file.stream.read(COPY_BUFFER_SIZE), b""):
+            temp.write(chunk)
+        file_path, digest = temp.commit(file.filename)
+    return file_path, digest, file.filename
+
+
+####################################################################################################
+# 分段續傳
+####################################################################################################
+
+
+class UploadSession:
+    """
+    一個分段上傳：暫存檔路徑、已收到的位移、SHA-256 狀態與完成後的結果。
+    暫存檔只在寫入每段資料時以附加模式開啟，閒置的上傳不會佔用檔案描述符。
+    """
+    __slots__ = ("id", "kind", "filename", "size", "client", "path", "sha256", "offset", "result", "lock",
+                 "updated_at")
+
+    def __init__(self, kind: str, filename: str, size: int, client: str = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.size = size
+        self.client = client
+        self.path = os.path.join(TEMP_FOLDER, f".upload_{self.id}")
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+        self.result = None
+        self.lock = threading.Lock()
+        self.updated_at = time.time()
+
+    def write(self, stream, length: int):
+        """
+        從串流讀取 length bytes 附加到暫存檔。連線中斷時 offset 只包含已完整寫入的部分。
+        """
+        remaining = length
+        with open(self.path, "ab") as f:
+            while remaining > 0:
+                chunk = stream.read(min(COPY_BUFFER_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                self.sha256.update(chunk)
+                self.offset += len(chunk)
+                remaining -= len(chunk)
+
+    def commit(self) -> tuple[str, str]:
+        """
+        將暫存檔移到最終位置（以 SHA-256 前綴命名）。
+        :return: (檔案路徑, SHA-256)
+        """
+        if self.size == 0:
+            # 沒有寫入任何資料時暫存檔尚未建立
+            open(self.path, "ab").close()
+        digest = self.sha256.hexdigest()
+        file_path = _final_path(digest, self.filename)
+        os.replace(self.path, file_path)
+        return file_path, digest
+
+    def discard(self):
+        """
+        刪除未完成的暫存檔，或完成但沒有被使用的檔案。
+        """
+        path = self.result[0] if self.result else self.path
+        if os.path.exists(path):
+            os.unlink(path)
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.id,
+            "offset": self.offset,
+            "size": self.size,
+            "chunk_size": CHUNK_SIZE,
+            "complete": self.result is not None,
+            "sha256": self.result[1] if self.result else None,
+        }
+
+
+class UploadSessions:
+    def __init__(self):
+        self._sessions: dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, filename: str, size: int, client: str = None) -> UploadSession:
+        """
+        建立分段上傳，建立時就檢查類型與大小。
+        :param client: 用戶端識別（例如 IP），用來限制每個用戶端同時存在的上傳數量
+        :raises TooManyRequests: 超過 MAX_SESSIONS 或 MAX_SESSIONS_PER_CLIENT
+        """
+        if kind not in UPLOAD_KINDS:
+            raise BadRequest(f"未知的上傳種類：{kind}")
+        check_file_type(kind, filename)
+        check_file_size(kind, size)
+        self.expire()
+        session = UploadSession(kind, filename, size, client)
+        with self._lock:
+            if len(self._sessions) >= MAX_SESSIONS:
+                raise TooManyRequests("進行中的上傳過多，請稍後再試")
+            if sum(1 for other in self._sessions.values() if other.client == client) >= MAX_SESSIONS_PER_CLIENT:
+                raise TooManyRequests("同時進行的上傳過多，請先完成或等待其他上傳")
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, upload_id: str):
+        with self._lock:
+            return self._sessions.get(upload_id)
+
+    def take(self, upload_id: str, kind: str):
+        """
+        取出並移除已完成且種類相符的上傳，找不到時回傳 None。
+        """
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None or session.result is None or session.kind != kind:
+                return None
+            del self._sessions[upload_id]
+            return session
+
+    def append(self, upload_id: str, start: int, stream, length: int) -> UploadSession:
+        """
+        寫入一段資料。start 必須等於目前已收到的位移，否則丟出 Conflict，讓用戶端重新查詢位移。
+        :param stream: 請求內容的串流，直接寫入暫存檔
+        :param length: 這段資料的長度
+        """
+        session = self.get(upload_id)
+        if session is None:
+            raise NotFound("找不到上傳")
+        with session.lock:
+            if session.result is not None:
+                return session
+            if start != session.offset:
+                raise Conflict(f"位移不符，目前已收到 {session.offset} bytes")
+            if session.offset + length > session.size:
+                raise RequestEntityTooLarge("資料超過宣告的檔案大小")
+            try:
+                session.write(stream, length)
+            finally:
+                session.updated_at = time.time()
+        return session
+
+    def complete(self, upload_id: str) -> UploadSession:
+        """
+        所有資料都收到後，將檔案移到最終位置。
+        """
+        session = self.get(upload_id)
+        if session is None:
+            raise NotFound("找不到上傳")
+        with session.lock:
+            if session.result is None:
+                if session.offset != session.size:
+                    raise Conflict(f"上傳未完成，目前已收到 {session.offset} bytes")
+                session.result = session.commit()
+                session.updated_at = time.time()
+        # 完成但沒有被使用的上傳也會在 SESSION_TTL 後移除
+        self.expire()
+        return session
+
+    def expire(self):
+        """
+        刪除閒置超過 SESSION_TTL 的上傳，連同暫存檔或已完成但沒有被使用的檔案。
+        """
+        now = time.time()
+        with self._lock:
+            expired = [session for session in self._sessions.values() if now - session.updated_at > SESSION_TTL]
+            for session in expired:
+                del self._sessions[session.id]
+        for session in expired:
+            with session.lock:
+                session.discard()
+
+
+upload_sessions = UploadSessions()
+
+
+def parse_content_range(header: str, length: int) -> int:
+    """
+    解析 "bytes start-end/total"，回傳 start；沒有 Content-Range 時視為從 0 開始。
+    """
+    if not header:
+        return 0
+    try:
+        unit, _, spec = header.partition(" ")
+        byte_range = spec.split("/")[0]
+        start, end = (int(value) for value in byte_range.split("-"))
+    except ValueError:
+        raise BadRequest("Content-Range 格式錯誤")
+    if unit != "bytes" or end - start + 1 != length:
+        raise BadRequest("Content-Range 與資料長度不符")
+    return start
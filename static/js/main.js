@@ -5,10 +5,14 @@ const chatModeNames = {
     'SUB_TRANSLATE': '字幕翻譯 (提示：檔案大小愈大，翻譯時間愈長)'
 };
 
+// 目前的聊天模式，決定上傳檔案的種類
+let currentChatMode = 'GEMINI';
+
 function setChatMode(mode) {
     fetch(`/set_chat_mode/${mode}`, { method: 'POST' })
         .then(response => response.text())
         .then(data => {
+            currentChatMode = mode;
             document.getElementById('current-mode').textContent = `目前模式: ${chatModeNames[mode]}`;
             document.getElementById('chat-box').innerHTML = ''; // 清空對話框
 
@@ -77,6 +81,16 @@ function handleKeyDown(event) {
     }
 }
 
+// 網頁用戶端 ID，伺服器以此區分各自的 Gemini 對話紀錄
+function getClientId() {
+    let clientId = localStorage.getItem('client_id');
+    if (!clientId) {
+        clientId = crypto.randomUUID();
+        localStorage.setItem('client_id', clientId);
+    }
+    return clientId;
+}
+
 function sendMessage() {
     const inputElement = document.getElementById('chat-input');
     const message = inputElement.value;
@@ -93,7 +107,7 @@ function sendMessage() {
         headers: {
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify({ message })
+        body: JSON.stringify({ message, client_id: getClientId() })
     })
     .then(response => response.json())
     .then(data => {
@@ -140,12 +154,17 @@ function uploadFile() {
     }
 
     const formData = new FormData();
-    formData.append('file', file);
+    // 大型檔案先以分段續傳上傳，再以 upload_id 送出；字幕翻譯模式上傳影片，其他模式上傳圖片
+    const kind = currentChatMode === 'SUB_TRANSLATE' ? 'video' : 'image';
+    const upload = file.size > CHUNKED_UPLOAD_THRESHOLD
+        ? uploadInChunks(file, kind).then(uploadId => formData.append('upload_id', uploadId))
+        : Promise.resolve(formData.append('file', file));
 
-    fetch('/upload_file', {
+    upload
+    .then(() => fetch('/upload_file', {
         method: 'POST',
         body: formData
-    })
+    }))
     .then(response => response.json())
     .then(data => {
         const botMessage = document.createElement('div');
@@ -159,6 +178,189 @@ function uploadFile() {
         botMessage.className = 'chat-message bot';
         chatBox.appendChild(botMessage);
         chatBox.scrollTop = chatBox.scrollHeight;
+
+        // 字幕工作在背景執行，輪詢進度直到完成
+        if (data.job_id) {
+            pollJob(data.job_id, job => {
+                botMessage.textContent = formatJobStatus(job);
+                chatBox.scrollTop = chatBox.scrollHeight;
+            });
+        }
     })
     .catch(error => console.error('Error:', error));
 }
+
+function formatJobStatus(job) {
+    if (job.status === 'done') {
+        return `機器人：字幕處理完成 ${job.result_url}`;
+    }
+    if (job.status === 'failed') {
+        return `機器人：字幕處理失敗：${job.error}`;
+    }
+    return `機器人：${job.stage} (${job.progress}%)`;
+}
+
+function pollJob(jobId, onUpdate, interval = 2000) {
+    fetch(`/jobs/${jobId}`)
+        .then(response => response.json())
+        .then(job => {
+            onUpdate(job);
+            if (job.status !== 'done' && job.status !== 'failed') {
+                setTimeout(() => pollJob(jobId, onUpdate, interval), interval);
+            }
+        })
+        .catch(error => console.error('Error:', error));
+}
+
+function renderJobStatus(status, job) {
+    if (job.status === 'done') {
+        status.innerHTML = `字幕處理完成：<a href="${job.result_url}?download=1">下載影片</a>
+            <video class="subtitle-video" src="${job.result_url}" controls preload="metadata"></video>`;
+    } else if (job.status === 'failed') {
+        status.textContent = `字幕處理失敗：${job.error}`;
+    } else {
+        status.textContent = `${job.stage} (${job.progress}%)`;
+    }
+}
+
+function appendCue(container, cue) {
+    const cueElement = document.createElement('div');
+    cueElement.className = 'subtitle-cue';
+
+    const timing = document.createElement('div');
+    timing.className = 'subtitle-cue-time';
+    timing.textContent = `${cue.index}  ${cue.start} --> ${cue.end}`;
+    cueElement.appendChild(timing);
+
+    const lines = Object.values(cue.translations || {});
+    lines.push(cue.text);
+    for (const line of lines) {
+        const text = document.createElement('div');
+        text.textContent = line;
+        cueElement.appendChild(text);
+    }
+
+    container.appendChild(cueElement);
+    container.scrollTop = container.scrollHeight;
+}
+
+function streamJob(jobId, status, cues) {
+    // 不支援 EventSource 時改用輪詢
+    if (!window.EventSource) {
+        pollJob(jobId, job => renderJobStatus(status, job));
+        return;
+    }
+    const source = new EventSource(`/jobs/${jobId}/events`);
+    source.addEventListener('status', e => {
+        const data = JSON.parse(e.data);
+        renderJobStatus(status, { status: 'running', stage: data.stage, progress: data.progress });
+    });
+    source.addEventListener('cue', e => appendCue(cues, JSON.parse(e.data)));
+    source.addEventListener('done', e => {
+        renderJobStatus(status, { status: 'done', result_url: JSON.parse(e.data).result_url });
+        source.close();
+    });
+    source.addEventListener('error', e => {
+        if (e.data) {
+            renderJobStatus(status, { status: 'failed', error: JSON.parse(e.data).error });
+            source.close();
+        }
+    });
+}
+
+// 超過這個大小的檔案使用分段續傳
+const CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024;
+
+async function uploadInChunks(file, kind, onProgress) {
+    // 以檔名、大小與修改時間記住未完成的上傳，重新整理頁面後可以從中斷處繼續
+    const resumeKey = `upload:${kind}:${file.name}:${file.size}:${file.lastModified}`;
+    let session = null;
+    const savedId = localStorage.getItem(resumeKey);
+    if (savedId) {
+        const response = await fetch(`/upload_sessions/${savedId}`);
+        if (response.ok) session = await response.json();
+    }
+    if (!session) {
+        const response = await fetch('/upload_sessions', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size, kind })
+        });
+        session = await response.json();
+        if (!response.ok) throw new Error(session.reply);
+        localStorage.setItem(resumeKey, session.upload_id);
+    }
+
+    let offset = session.offset;
+    let retries = 0;
+    while (offset < file.size) {
+        const end = Math.min(offset + session.chunk_size, file.size);
+        try {
+            const response = await fetch(`/upload_sessions/${session.upload_id}`, {
+                method: 'PUT',
+                headers: { 'Content-Range': `bytes ${offset}-${end - 1}/${file.size}` },
+                body: file.slice(offset, end)
+            });
+            const data = await response.json();
+            if (!response.ok && response.status !== 409) throw new Error(data.reply);
+            // 409 表示位移不符，改從伺服器回報的位移繼續
+            offset = data.offset;
+            retries = 0;
+            if (onProgress) onProgress(Math.floor(offset * 100 / file.size));
+        } catch (error) {
+            if (++retries > 5) throw error;
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            const response = await fetch(`/upload_sessions/${session.upload_id}`);
+            if (response.ok) offset = (await response.json()).offset;
+        }
+    }
+
+    const response = await fetch(`/upload_sessions/${session.upload_id}/complete`, { method: 'POST' });
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.reply);
+    localStorage.removeItem(resumeKey);
+    return session.upload_id;
+}
+
+async function buildUploadForm(form, kind, status) {
+    const formData = new FormData(form);
+    const file = formData.get('file');
+    if (file && file.size > CHUNKED_UPLOAD_THRESHOLD) {
+        const uploadId = await uploadInChunks(file, kind, progress => {
+            status.textContent = `上傳中... (${progress}%)`;
+        });
+        formData.delete('file');
+        formData.append('upload_id', uploadId);
+    }
+    return formData;
+}
+
+function translateSrt(event) {
+    event.preventDefault();
+    const form = event.target;
+    const status = document.getElementById('subtitle-status');
+    const cues = document.getElementById('subtitle-cues');
+    status.textContent = '上傳中...';
+    cues.innerHTML = '';
+
+    buildUploadForm(form, 'video', status)
+    .then(formData => fetch(form.action, {
+        method: 'POST',
+        body: formData
+    }))
+    .then(response => response.json())
+    .then(data => {
+        if (data.result_url) {
+            renderJobStatus(status, { status: 'done', result_url: data.result_url });
+            return;
+        }
+        status.textContent = data.reply;
+        if (data.job_id) {
+            streamJob(data.job_id, status, cues);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        status.textContent = `上傳失敗：${error.message}`;
+    });
+}